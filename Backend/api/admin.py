@@ -1,7 +1,149 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections, router
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.text import smart_split, unescape_string_literal
 from .models import User, SensorReading, Alert
 
+
+# ==================== LARGE TABLE SUPPORT ====================
+#
+# The reading and alert tables hold millions of rows. These helpers keep
+# their changelists off full-table scans: counts are estimated or capped,
+# distinct filter values are cached, date hierarchy levels are found by
+# index probes, and prefix search becomes an index range scan.
+
+def estimated_row_count(model):
+    """
+    Row count of an unfiltered table: pg_class on PostgreSQL, elsewhere an
+    exact COUNT(*) cached for ADMIN_COUNT_CACHE_SECONDS. (A primary key
+    range would count the gaps retention's deletes leave.)
+    """
+    connection = connections[router.db_for_read(model)]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+            row = cursor.fetchone()
+        return max(int(row[0] or 0), 0) if row else 0
+
+    key = f'admin-count:{model._meta.label_lower}'
+    count = cache.get(key)
+    if count is None:
+        count = model._default_manager.count()
+        cache.set(key, count, settings.ADMIN_COUNT_CACHE_SECONDS)
+    return count
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Unfiltered lists larger than ADMIN_EXACT_COUNT_LIMIT report an estimate;
+    filtered lists count at most that many rows, so narrow the filter (or
+    the date hierarchy) to page further.
+    """
+
+    @cached_property
+    def count(self):
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model)
+            if estimate > limit:
+                return estimate
+        return min(queryset.order_by()[:limit + 1].count(), limit)
+
+
+class CachedValuesFieldListFilter(admin.AllValuesFieldListFilter):
+    """Distinct values filter whose choices are cached for ADMIN_FILTER_CACHE_SECONDS"""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = f'admin-filter:{model._meta.label_lower}:{field_path}'
+        choices = cache.get(key)
+        if choices is None:
+            choices = list(self.lookup_choices)
+            cache.set(key, choices, settings.ADMIN_FILTER_CACHE_SECONDS)
+        self.lookup_choices = choices
+
+
+def _period_start(value, kind, tz):
+    return datetime(value.year, 1 if kind == 'year' else value.month, 1 if kind != 'day' else value.day, tzinfo=tz)
+
+
+def _next_period(start, kind, tz):
+    if kind == 'year':
+        return datetime(start.year + 1, 1, 1, tzinfo=tz)
+    if kind == 'month':
+        return datetime(start.year + start.month // 12, start.month % 12 + 1, 1, tzinfo=tz)
+    following = start.date() + timedelta(days=1)
+    return datetime(following.year, following.month, following.day, tzinfo=tz)
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """
+    `datetimes()` for the date hierarchy, answered by walking the index:
+    one "first value at or after the next period" query per period that
+    has rows, instead of truncating every row.
+    """
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None, is_dst=timezone.NOT_PASSED):
+        if kind not in ('year', 'month', 'day') or not settings.USE_TZ:
+            return super().datetimes(field_name, kind, order, tzinfo, is_dst)
+        tz = tzinfo or timezone.get_current_timezone()
+        ordered = self.order_by(field_name).values_list(field_name, flat=True)
+
+        periods = []
+        value = ordered.first()
+        while value is not None:
+            start = _period_start(timezone.localtime(value, tz), kind, tz)
+            periods.append(start)
+            value = ordered.filter(**{f'{field_name}__gte': _next_period(start, kind, tz)}).first()
+        return periods if order == 'ASC' else periods[::-1]
+
+
+class LargeTableChangeList(ChangeList):
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(model=queryset.model, query=queryset.query.chain(), using=queryset.db)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    `^field` entries in search_fields are matched as case-sensitive range
+    scans (as typed, UPPER, lower and Title case), which an ordinary index
+    serves; SQLite's LIKE cannot use one.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        prefix_fields = [name[1:] for name in self.get_search_fields(request) if name.startswith('^')]
+        if not prefix_fields:
+            return super().get_search_results(request, queryset, search_term)
+
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            match = Q()
+            for variant in {bit, bit.upper(), bit.lower(), bit.title()}:
+                for name in prefix_fields:
+                    match |= Q(**{f'{name}__gte': variant, f'{name}__lt': variant + '\U0010ffff'})
+            queryset = queryset.filter(match)
+        return queryset, False
+
+
+# ==================== MODEL ADMINS ====================
+
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
     list_display = ['username', 'email', 'role', 'is_active']
@@ -11,13 +153,26 @@ class UserAdmin(BaseUserAdmin):
     )
 
 @admin.register(SensorReading)
-class SensorReadingAdmin(admin.ModelAdmin):
+class SensorReadingAdmin(LargeTableAdmin):
     list_display = ['sensor_id', 'timestamp', 'slope_zone', 'rockfall_risk_score', 'rockfall_occurred']
-    list_filter = ['sensor_status', 'rockfall_occurred', 'slope_zone']
-    search_fields = ['sensor_id', 'slope_zone']
+    list_filter = [
+        ('sensor_status', CachedValuesFieldListFilter),
+        'rockfall_occurred',
+        ('slope_zone', CachedValuesFieldListFilter),
+    ]
+    search_fields = ['^sensor_id', '^slope_zone']
+    date_hierarchy = 'timestamp'
+    # Only indexed columns, so sorting never sorts the whole table
+    sortable_by = ['sensor_id', 'timestamp', 'slope_zone']
 
 @admin.register(Alert)
-class AlertAdmin(admin.ModelAdmin):
+class AlertAdmin(LargeTableAdmin):
     list_display = ['alert_id', 'zone_name', 'alert_type', 'status', 'risk_score', 'created_at']
-    list_filter = ['alert_type', 'status']
-    search_fields = ['alert_id', 'zone_name']
+    list_filter = ['alert_type', 'status', ('zone_name', CachedValuesFieldListFilter)]
+    # zone_name has no index, so a zone search scans the alert table; it is
+    # kept because alerts are a small fraction of the readings.
+    search_fields = ['^alert_id', '^zone_name']
+    autocomplete_fields = ['sensor_reading']
+    # Newest first; created_at is indexed
+    ordering = ['-created_at']
+    sortable_by = ['alert_id', 'created_at']
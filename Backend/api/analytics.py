@@ -0,0 +1,537 @@
+"""
+In-process columnar snapshot of sensor readings for ad-hoc analytics.
+
+The snapshot holds one NumPy array per `SensorReading` column, covering
+the hot table and the retention archive. Text columns are dictionary
+encoded, so filters and group-bys on them compare small integers.
+Queries run against the snapshot only, never the OLTP tables.
+
+Each snapshot records the `caching.SENSORS` version token it was built
+from. Every ANALYTICS_REFRESH_SECONDS the store compares that token with
+the current one and, if data has changed, rebuilds in a background
+thread while the old snapshot keeps answering. Results are cached by
+query hash and snapshot token, so a rebuilt snapshot never serves a
+stale answer.
+
+A query is a JSON object:
+
+    {
+        "where": [["precipitation_in", "gt", 0], ["slope_zone", "in", ["Zone A", "Zone B"]]],
+        "group_by": ["rock_type", "slope_zone", "timestamp:month", "depth_to_water_ft:50"],
+        "select": {"pore_pressure": "mean(pore_pressure_psi)", "readings": "count()"},
+        "order_by": ["-pore_pressure"],
+        "limit": 100
+    }
+
+`group_by` entries are column names, `timestamp:<hour|day|month|year>`
+time buckets, or `<number column>:<width>` bins labelled by their lower
+bound. Aggregates ignore nulls; `mean` of a boolean column is a rate.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import caching, metrics, retention
+from .models import SensorReading
+
+logger = logging.getLogger(__name__)
+
+EXCLUDED_COLUMNS = ('id', 'created_at')
+
+FILTER_OPS = {
+    'eq': np.equal, 'ne': np.not_equal,
+    'lt': np.less, 'lte': np.less_equal, 'gt': np.greater, 'gte': np.greater_equal,
+}
+KIND_FILTER_OPS = {
+    'number': set(FILTER_OPS) | {'in', 'between', 'isnull'},
+    'datetime': set(FILTER_OPS) | {'between'},
+    'bool': {'eq', 'ne'},
+    'category': {'eq', 'ne', 'in'},
+}
+KIND_AGGREGATES = {
+    'number': {'count', 'sum', 'mean', 'min', 'max', 'std'},
+    'bool': {'count', 'sum', 'mean'},
+    'datetime': {'count', 'min', 'max'},
+    'category': {'count'},
+}
+TIME_BUCKETS = {'hour': 'h', 'day': 'D', 'month': 'M', 'year': 'Y'}
+AGGREGATE_RE = re.compile(r'^\s*(\w+)\(\s*(\w*)\s*\)\s*$')
+CACHE_PREFIX = 'analytics'
+PART_ROWS = 20000
+
+metrics.registry.describe('analytics_snapshot_build_seconds', 'Analytics snapshot build time.')
+metrics.registry.describe('analytics_query_seconds', 'Analytics query time on the snapshot (cache misses).')
+
+
+class QueryError(ValueError):
+    pass
+
+
+def refresh_seconds():
+    return float(getattr(settings, 'ANALYTICS_REFRESH_SECONDS', 60))
+
+
+def max_groups():
+    return int(getattr(settings, 'ANALYTICS_MAX_GROUPS', 10000))
+
+
+def data_version():
+    return caching.current([caching.SENSORS])[0]
+
+
+# ==================== SNAPSHOT ====================
+
+class Snapshot:
+    """
+    Column arrays plus, for text columns, their sorted distinct values
+    (`columns[name]` then holds int32 codes into `categories[name]`).
+    """
+
+    def __init__(self, columns, categories, kinds, version, built_at):
+        self.columns = columns
+        self.categories = categories
+        self.kinds = kinds
+        self.version = version
+        self.built_at = built_at
+        self.rows = len(columns['timestamp']) if columns else 0
+
+    def describe(self):
+        return {'version': self.version, 'built_at': self.built_at.isoformat(), 'rows': self.rows}
+
+
+def _columns():
+    fields = [field for field in SensorReading._meta.concrete_fields if field.attname not in EXCLUDED_COLUMNS]
+    kinds = {}
+    for field in fields:
+        kind = retention.column_kind(field)
+        kinds[field.attname] = {'decimal': 'number', 'int': 'number', 'str': 'category'}.get(kind, kind)
+    return fields, kinds
+
+
+def _hot_parts(fields, kinds):
+    """
+    Hot-table rows as column arrays in the archive's encoding, read with
+    a plain cursor: per-value ORM conversion (Decimal, aware datetimes)
+    would cost several times the query itself.
+    """
+    queryset = SensorReading.objects.order_by().values_list(*[field.attname for field in fields])
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(PART_ROWS)
+            if not rows:
+                break
+            part = {}
+            for field, values in zip(fields, zip(*rows)):
+                kind = kinds[field.attname]
+                if kind == 'datetime':
+                    # Naive values are UTC, as stored with USE_TZ.
+                    values = [v if v.tzinfo is None else v.astimezone(datetime.timezone.utc).replace(tzinfo=None) for v in values]
+                    part[field.attname] = np.array(values, dtype='datetime64[us]').astype(np.int64)
+                elif kind == 'number' and field.get_internal_type() == 'DecimalField':
+                    part[field.attname] = np.array(values, dtype=np.float64)  # None becomes NaN
+                elif kind == 'number':
+                    part[field.attname] = np.array(values, dtype=np.int64)
+                elif kind == 'bool':
+                    part[field.attname] = np.array(values, dtype=bool)
+                else:
+                    part[field.attname] = np.array(values, dtype=str)
+            yield part
+
+
+@metrics.timed('analytics_snapshot_build_seconds')
+def build():
+    """Read the archive and the hot table into a new snapshot"""
+    # Taken first: rows written while we read make the next check rebuild.
+    version = data_version()
+    fields, kinds = _columns()
+    names = [field.attname for field in fields]
+
+    parts = list(retention.iter_archive(columns=names))
+    parts.extend(_hot_parts(fields, kinds))
+    if not parts:
+        parts.append(retention.encode_columns([], fields))
+
+    columns, categories = {}, {}
+    for name in names:
+        values = np.concatenate([part[name] for part in parts])
+        if kinds[name] == 'category':
+            categories[name], codes = np.unique(values, return_inverse=True)
+            values = codes.ravel().astype(np.int32)
+        columns[name] = values
+    return Snapshot(columns, categories, kinds, version, timezone.now())
+
+
+class SnapshotStore:
+    """The current snapshot of this process, refreshed when data changes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._refreshing = False
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self._first()
+        with self._lock:
+            due = not self._refreshing and time.monotonic() - self._checked_at >= refresh_seconds()
+            if due:
+                self._checked_at = time.monotonic()
+        if due and data_version() != snapshot.version:
+            with self._lock:
+                if self._refreshing:
+                    return snapshot
+                self._refreshing = True
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return snapshot
+
+    def _first(self):
+        # Cold requests queue on the build lock; only the first one builds.
+        with self._build_lock:
+            if self._snapshot is not None:
+                return self._snapshot
+            return self._build()
+
+    def refresh(self):
+        """Build a snapshot now and make it current"""
+        with self._build_lock:
+            return self._build()
+
+    def _build(self):
+        snapshot = build()
+        with self._lock:
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+        return snapshot
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception('Failed to refresh analytics snapshot')
+        finally:
+            with self._lock:
+                self._refreshing = False
+            connections.close_all()
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+
+snapshots = SnapshotStore()
+
+
+# ==================== QUERY SPEC ====================
+
+def _parse_time(value):
+    parsed = None
+    if isinstance(value, str):
+        try:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                day = parse_date(value)
+                if day is not None:
+                    parsed = datetime.datetime(day.year, day.month, day.day)
+        except ValueError:
+            pass
+    if parsed is None:
+        raise QueryError(f'{value!r} is not an ISO date or datetime')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return retention.to_micros(parsed)
+
+
+def _scalar(kind, value, name):
+    if kind == 'datetime':
+        return _parse_time(value)
+    if kind == 'bool':
+        if not isinstance(value, bool):
+            raise QueryError(f'{name} compares with true or false')
+        return value
+    if kind == 'category':
+        if not isinstance(value, str):
+            raise QueryError(f'{name} compares with strings')
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise QueryError(f'{name} compares with numbers')
+    return value
+
+
+def parse(spec, kinds):
+    """Validate a query and return it in canonical form"""
+    if not isinstance(spec, dict):
+        raise QueryError('Query must be a JSON object')
+    unknown = set(spec) - {'where', 'group_by', 'select', 'order_by', 'limit'}
+    if unknown:
+        raise QueryError(f'Unknown query keys: {", ".join(sorted(unknown))}')
+
+    def column(name):
+        if name not in kinds:
+            raise QueryError(f'Unknown column {name!r}')
+        return kinds[name]
+
+    where = []
+    for condition in spec.get('where') or []:
+        if not isinstance(condition, (list, tuple)) or len(condition) != 3:
+            raise QueryError('Conditions are [column, op, value] triples')
+        name, op, value = condition
+        kind = column(name)
+        if op not in KIND_FILTER_OPS[kind]:
+            raise QueryError(f'{op!r} does not apply to {name} (use {", ".join(sorted(KIND_FILTER_OPS[kind]))})')
+        if op == 'isnull':
+            value = bool(value)
+        elif op == 'in':
+            if not isinstance(value, list):
+                raise QueryError(f'{name} in takes a list')
+            value = sorted({_scalar(kind, item, name) for item in value})
+        elif op == 'between':
+            if not isinstance(value, list) or len(value) != 2:
+                raise QueryError(f'{name} between takes [low, high]')
+            value = [_scalar(kind, item, name) for item in value]
+        else:
+            value = _scalar(kind, value, name)
+        where.append([name, op, value])
+
+    group_by = []
+    for key in spec.get('group_by') or []:
+        if not isinstance(key, str):
+            raise QueryError('group_by entries are strings')
+        name, _, arg = key.partition(':')
+        kind = column(name)
+        if arg and kind == 'datetime':
+            if arg not in TIME_BUCKETS:
+                raise QueryError(f'{name} buckets are {", ".join(TIME_BUCKETS)}')
+        elif arg:
+            try:
+                width = float(arg)
+            except ValueError:
+                width = 0
+            if kind != 'number' or not width > 0:
+                raise QueryError(f'{key!r}: only number columns take a positive bin width')
+        group_by.append(key)
+    if len(set(group_by)) != len(group_by):
+        raise QueryError('group_by has duplicates')
+
+    select = spec.get('select') or {'count': 'count()'}
+    if not isinstance(select, dict):
+        raise QueryError('select maps output names to aggregates like "mean(pore_pressure_psi)"')
+    aggregates = {}
+    for alias, expression in select.items():
+        match = AGGREGATE_RE.match(expression) if isinstance(expression, str) else None
+        if match is None:
+            raise QueryError(f'{alias}: aggregates look like "mean(pore_pressure_psi)" or "count()"')
+        op, name = match.groups()
+        if alias in group_by:
+            raise QueryError(f'{alias} is both a group and an aggregate')
+        if name:
+            kind = column(name)
+            if op not in KIND_AGGREGATES[kind]:
+                raise QueryError(f'{op} does not apply to {name} (use {", ".join(sorted(KIND_AGGREGATES[kind]))})')
+        elif op != 'count':
+            raise QueryError(f'{alias}: {op} needs a column')
+        aggregates[alias] = f'{op}({name})'
+
+    order_by = spec.get('order_by') or []
+    if isinstance(order_by, str):
+        order_by = [order_by]
+    for key in order_by:
+        if not isinstance(key, str) or (key.lstrip('-') not in aggregates and key.lstrip('-') not in group_by):
+            raise QueryError(f'Cannot order by {key!r}; use a group_by entry or select name')
+
+    limit = spec.get('limit', max_groups())
+    if isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= max_groups():
+        raise QueryError(f'limit must be between 1 and {max_groups()}')
+
+    return {'where': where, 'group_by': group_by, 'select': aggregates, 'order_by': order_by, 'limit': limit}
+
+
+# ==================== EXECUTION ====================
+
+def _mask(snapshot, where):
+    mask = np.ones(snapshot.rows, dtype=bool)
+    for name, op, value in where:
+        values = snapshot.columns[name]
+        if snapshot.kinds[name] == 'category':
+            # Compare codes; a value that never occurs matches nothing.
+            codes = np.flatnonzero(np.isin(snapshot.categories[name], value if op == 'in' else [value]))
+            matched = np.isin(values, codes)
+            mask &= ~matched if op == 'ne' else matched
+        elif op == 'isnull':
+            nulls = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(len(values), dtype=bool)
+            mask &= nulls if value else ~nulls
+        elif op == 'in':
+            mask &= np.isin(values, value)
+        elif op == 'between':
+            mask &= (values >= value[0]) & (values <= value[1])
+        else:
+            mask &= FILTER_OPS[op](values, value)
+    return mask
+
+
+def _group_codes(snapshot, key, mask):
+    """(codes, labels) of one group_by entry over the masked rows"""
+    name, _, arg = key.partition(':')
+    values = snapshot.columns[name][mask]
+    kind = snapshot.kinds[name]
+    if kind == 'category':
+        return values, snapshot.categories[name].tolist()
+    if kind == 'datetime':
+        stamps = values.astype('datetime64[us]')
+        if arg:
+            stamps = stamps.astype(f'datetime64[{TIME_BUCKETS[arg]}]').astype('datetime64[us]')
+        labels, codes = np.unique(stamps, return_inverse=True)
+        return codes.ravel(), [retention.from_micros(v).isoformat() for v in labels.astype(np.int64)]
+    if arg:
+        width = float(arg)
+        values = np.floor(values / width) * width
+    labels, codes = np.unique(values, return_inverse=True)
+    return codes.ravel(), [_json_value(v) for v in labels.tolist()]
+
+
+def _json_value(value):
+    if isinstance(value, float) and np.isnan(value):
+        return None
+    return value
+
+
+def _sort_key(value, descending):
+    # Nulls sort last either way.
+    if value is None:
+        return (not descending, 0)
+    return (descending, value)
+
+
+def _aggregate(op, values, inverse, groups):
+    if values is None:  # count()
+        return np.bincount(inverse, minlength=groups).astype(np.int64)
+    values = values.astype(np.float64)
+    valid = ~np.isnan(values)
+    counts = np.bincount(inverse, weights=valid, minlength=groups)
+    if op == 'count':
+        return counts.astype(np.int64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if op in ('min', 'max'):
+            result = np.full(groups, np.inf if op == 'min' else -np.inf)
+            (np.minimum if op == 'min' else np.maximum).at(result, inverse[valid], values[valid])
+            result[counts == 0] = np.nan
+            return result
+        sums = np.bincount(inverse, weights=np.where(valid, values, 0), minlength=groups)
+        if op == 'sum':
+            return sums
+        means = sums / counts
+        if op == 'mean':
+            return means
+        deviations = np.where(valid, values - means[inverse], 0)
+        return np.sqrt(np.bincount(inverse, weights=deviations ** 2, minlength=groups) / (counts - 1))
+
+
+def execute(snapshot, query):
+    """Run a parsed query against a snapshot"""
+    mask = _mask(snapshot, query['where'])
+    matched = int(mask.sum())
+
+    if query['group_by']:
+        keys = [_group_codes(snapshot, key, mask) for key in query['group_by']]
+        combined = np.zeros(matched, dtype=np.int64)
+        cardinality = 1
+        for codes, labels in keys:
+            cardinality *= max(len(labels), 1)
+            if cardinality > 2 ** 62:
+                raise QueryError('Too many group combinations; group by fewer columns')
+            combined = combined * max(len(labels), 1) + codes
+        present, inverse = np.unique(combined, return_inverse=True)
+        inverse = inverse.ravel()
+        if len(present) > max_groups():
+            raise QueryError(f'{len(present)} groups exceed ANALYTICS_MAX_GROUPS ({max_groups()}); filter or bin further')
+        # Split the combined ids back into per-key label indexes, last key first.
+        label_index = []
+        remainder = present
+        for codes, labels in reversed(keys):
+            remainder, index = np.divmod(remainder, max(len(labels), 1))
+            label_index.append(index.tolist())
+        label_index.reverse()
+        groups = len(present)
+    else:
+        keys, label_index = [], []
+        inverse = np.zeros(matched, dtype=np.int64)
+        groups = 1
+
+    rows = [{} for _ in range(groups)]
+    for key, (codes, labels), indexes in zip(query['group_by'], keys, label_index):
+        for row, index in zip(rows, indexes):
+            row[key] = labels[index]
+
+    for alias, expression in query['select'].items():
+        op, name = AGGREGATE_RE.match(expression).groups()
+        values = snapshot.columns[name][mask] if name else None
+        result = _aggregate(op, values, inverse, groups)
+        if name and snapshot.kinds[name] == 'datetime' and op != 'count':
+            output = [None if np.isnan(v) else retention.from_micros(v).isoformat() for v in result.tolist()]
+        else:
+            output = [_json_value(v) for v in result.tolist()]
+        for row, value in zip(rows, output):
+            row[alias] = value
+
+    for key in reversed(query['order_by']):
+        name = key.lstrip('-')
+        descending = key.startswith('-')
+        rows.sort(key=lambda row: _sort_key(row[name], descending), reverse=descending)
+
+    limit = query['limit']
+    return {
+        'rows_scanned': snapshot.rows,
+        'rows_matched': matched,
+        'groups': len(rows),
+        'truncated': len(rows) > limit,
+        'results': rows[:limit],
+    }
+
+
+def query_hash(query):
+    return hashlib.sha256(json.dumps(query, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def run(spec):
+    """
+    Validate and answer a query from the current snapshot, caching the
+    result under the query hash and the snapshot's version token.
+    """
+    snapshot = snapshots.get()
+    query = parse(spec, snapshot.kinds)
+    key = f'{CACHE_PREFIX}:{snapshot.version}:{query_hash(query)}'
+    result = cache.get(key)
+    cached = result is not None
+    if not cached:
+        with metrics.timer('analytics_query_seconds'):
+            result = execute(snapshot, query)
+        cache.set(key, result, getattr(settings, 'ANALYTICS_CACHE_SECONDS', 300))
+    return {'snapshot': snapshot.describe(), 'cached': cached, **result}
+
+
+def schema():
+    """Columns that can be queried, with the filters and aggregates each allows"""
+    _, kinds = _columns()
+    return {
+        'columns': {
+            name: {'kind': kind, 'filters': sorted(KIND_FILTER_OPS[kind]), 'aggregates': sorted(KIND_AGGREGATES[kind])}
+            for name, kind in kinds.items()
+        },
+        'time_buckets': list(TIME_BUCKETS),
+        'max_groups': max_groups(),
+    }
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Connect the user cache invalidation, data version and SQLite connection setup signals
+        from . import authentication, caching, db  # noqa: F401
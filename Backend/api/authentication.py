@@ -0,0 +1,125 @@
+"""
+JWT authentication without a user query on every request.
+
+Tokens issued by `RoleRefreshToken` carry the user's role next to the id,
+and `CachedJWTAuthentication` resolves the id through a short-TTL
+in-process cache instead of loading the `User` row each time. Saving or
+deleting a user drops its entry in this process; other workers pick the
+change up once their entry expires (AUTH_USER_CACHE_SECONDS). A token
+whose role claim no longer matches the user is rejected, so demoted
+users have to log in again.
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import User
+
+ROLE_CLAIM = 'role'
+
+
+class EmailBackend(ModelBackend):
+    """`authenticate(request, email=..., password=...)` with one indexed lookup by email"""
+
+    def authenticate(self, request, email=None, password=None, **kwargs):
+        if email is None or password is None:
+            return None
+        user = User._default_manager.filter(email=email).first()
+        if user is None:
+            # Hash anyway so unknown emails take as long as wrong passwords.
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+class RoleRefreshToken(RefreshToken):
+    """Refresh token whose access tokens also carry the user's role"""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[ROLE_CLAIM] = user.role
+        return token
+
+
+class UserCache:
+    """Thread-safe user-id -> (expires_at, user) map"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            return entry[1]
+
+    def set(self, user_id, user, ttl):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + ttl, user)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def _invalidate_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        ttl = getattr(settings, 'AUTH_USER_CACHE_SECONDS', 0)
+        user = user_cache.get(user_id) if ttl > 0 else None
+        if user is None:
+            user = super().get_user(validated_token)
+            if ttl > 0:
+                user_cache.set(user_id, user, ttl)
+        else:
+            self._check_cached(user, validated_token)
+
+        role = validated_token.get(ROLE_CLAIM)
+        if role is not None and role != user.role:
+            raise AuthenticationFailed('User role has changed; log in again', code='role_changed')
+
+        # Each request gets its own copy so views can't leak changes into the cache.
+        return copy.copy(user)
+
+    def _check_cached(self, user, validated_token):
+        """The same checks `JWTAuthentication.get_user` makes after loading the user"""
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
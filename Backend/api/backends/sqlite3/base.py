@@ -0,0 +1,32 @@
+"""
+The stock SQLite backend, plus the `transaction_mode` option Django 5.1
+adds: with OPTIONS['transaction_mode'] = 'IMMEDIATE', every transaction
+opens with BEGIN IMMEDIATE and takes the write lock up front.
+
+A deferred BEGIN takes it at the first write instead. If another
+connection committed after the transaction's first read, SQLite cannot
+upgrade the stale snapshot and fails with "database is locked" at once,
+without waiting out the busy timeout.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'EXCLUSIVE', 'IMMEDIATE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    transaction_mode = None
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        mode = kwargs.pop('transaction_mode', None)
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}")
+        self.transaction_mode = mode and mode.upper()
+        return kwargs
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
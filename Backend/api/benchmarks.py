@@ -0,0 +1,344 @@
+"""
+Reproducible performance benchmarks for the ingest, query and inference paths.
+
+`generate_readings` builds synthetic datasets in the `training_data_500.csv`
+schema with vectorized NumPy/pandas code, `run` drives the real endpoints
+through DRF's test client against whatever database is active (the
+`benchmark` command and the tests use a throwaway test database), and
+`compare` checks a result against a stored JSON baseline.
+`run_read_during_ingest` measures read latency from concurrent threads
+while an upload is running; it needs a file-backed database
+(`throwaway_database`).
+"""
+import json
+import math
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+from .models import SensorReading, User
+
+SAMPLE_CSV = settings.BASE_DIR / 'training_data_500.csv'
+BASELINE_DIR = settings.BASE_DIR / 'benchmarks'
+DEFAULT_THRESHOLD = 0.25
+START = pd.Timestamp('2024-01-01 00:00:00')
+
+SIZES = {'10k': 10000, '100k': 100000, '1M': 1000000}
+
+# name: (unit, which direction is better)
+METRICS = {
+    'ingest_rows_per_s': ('rows/s', 'higher'),
+    'list_first_page_ms': ('ms', 'lower'),
+    'list_last_page_ms': ('ms', 'lower'),
+    'statistics_ms': ('ms', 'lower'),
+    'dashboard_stats_ms': ('ms', 'lower'),
+    'predict_single_ms': ('ms', 'lower'),
+    'predict_sequential_ms': ('ms', 'lower'),
+    'peak_memory_mb': ('MB', 'lower'),
+    'concurrent_ingest_rows_per_s': ('rows/s', 'higher'),
+    'read_during_ingest_p50_ms': ('ms', 'lower'),
+    'read_during_ingest_p95_ms': ('ms', 'lower'),
+    'read_during_ingest_errors': ('errors', 'lower'),
+}
+
+# Absolute changes below these are timer and allocator noise on small
+# datasets, not regressions, whatever their relative size.
+NOISE_FLOOR = {'ms': 2.0, 'MB': 8.0}
+
+READ_DURING_INGEST_PATHS = ['/api/sensors/', '/api/sensors/statistics/', '/api/alerts/dashboard_stats/']
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Create a migrated test database in a temporary file for the duration of
+    the block, with the read alias mirroring it. A file, unlike SQLite's
+    in-memory test database, lets other threads open their own connections.
+    """
+    test_settings = connections['default'].settings_dict['TEST']
+    old_name = test_settings['NAME']
+    workdir = tempfile.TemporaryDirectory()
+    test_settings['NAME'] = str(Path(workdir.name) / 'test.sqlite3')
+    setup_test_environment()
+    try:
+        old_config = setup_databases(verbosity=0, interactive=False, serialized_aliases=())
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+    finally:
+        teardown_test_environment()
+        test_settings['NAME'] = old_name
+        workdir.cleanup()
+
+
+def parse_size(value):
+    """Accept '10k', '1M' or a plain row count"""
+    if value in SIZES:
+        return SIZES[value]
+    suffix = value[-1:].lower()
+    if suffix in ('k', 'm'):
+        return int(float(value[:-1]) * (1000 if suffix == 'k' else 1000000))
+    return int(value)
+
+
+# ==================== SYNTHETIC DATA ====================
+
+def generate_readings(rows, seed=0, hours_between_readings=1):
+    """
+    Return a DataFrame of `rows` synthetic readings in upload-CSV column order.
+
+    Sensors report round-robin, one reading per sensor every
+    `hours_between_readings`. Categorical columns are drawn from the
+    values seen in the sample CSV, numeric columns uniformly from its
+    observed range and rounded to the model field's precision.
+    """
+    sample = pd.read_csv(SAMPLE_CSV)
+    rng = np.random.default_rng(seed)
+
+    sensors = np.sort(sample['sensor_id'].unique())
+    index = np.arange(rows)
+    timestamps = START + pd.to_timedelta((index // len(sensors)) * hours_between_readings, unit='h')
+
+    data = {
+        'timestamp': timestamps.strftime('%Y-%m-%d %H:%M:%S'),
+        'year': timestamps.year,
+        'month': timestamps.month,
+        'day_of_year': timestamps.dayofyear,
+        'hour': timestamps.hour,
+        'sensor_id': sensors[index % len(sensors)],
+    }
+
+    for column in sample.columns:
+        if column in data:
+            continue
+        values = sample[column]
+        if column == 'rockfall_occurred':
+            data[column] = (rng.random(rows) < values.mean()).astype(int)
+        elif values.dtype.kind in 'OSU' or pd.api.types.is_string_dtype(values):
+            data[column] = rng.choice(np.sort(values.unique()), size=rows)
+        elif values.dtype.kind == 'i':
+            data[column] = rng.integers(values.min(), values.max() + 1, size=rows)
+        else:
+            places = SensorReading._meta.get_field(column).decimal_places
+            data[column] = np.round(rng.uniform(values.min(), values.max(), size=rows), places)
+
+    return pd.DataFrame(data, columns=list(sample.columns))
+
+
+def generate_csv(rows, seed=0):
+    return generate_readings(rows, seed).to_csv(index=False).encode()
+
+
+# ==================== RUNNER ====================
+
+def _median_ms(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        # Measure the query path, not the version-keyed response cache.
+        cache.clear()
+        started = time.perf_counter()
+        response = call()
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError(f'Benchmark request failed with {response.status_code}')
+    return round(statistics.median(timings), 3)
+
+
+def _proc_status_kib(key):
+    with open('/proc/self/status') as handle:
+        for line in handle:
+            if line.startswith(f'{key}:'):
+                return int(line.split()[1])
+    return None
+
+
+def _reset_peak_memory():
+    """
+    Reset the kernel's peak-RSS counter and return the current RSS in KiB
+    (None where /proc/self/clear_refs is unavailable, i.e. off Linux).
+    ru_maxrss can't be used: it never resets, so it would report the
+    TensorFlow import and every earlier size in the same process.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as handle:
+            handle.write('5')
+        return _proc_status_kib('VmRSS')
+    except OSError:
+        return None
+
+
+def _peak_memory_mb(start_kib):
+    """Peak RSS growth since `_reset_peak_memory`, in MB"""
+    if start_kib is None:
+        return None
+    return round(max(_proc_status_kib('VmHWM') - start_kib, 0) / 1024, 1)
+
+
+def _client():
+    from rest_framework.test import APIClient
+
+    user, _ = User.objects.get_or_create(username='benchmark', defaults={'role': 'ADMIN'})
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+def _upload(client, rows, seed):
+    upload = SimpleUploadedFile('benchmark.csv', generate_csv(rows, seed), content_type='text/csv')
+    started = time.perf_counter()
+    response = client.post('/api/sensors/upload_csv/', {'file': upload}, format='multipart')
+    elapsed = time.perf_counter() - started
+    if response.status_code != 201 or response.data.get('created') != rows:
+        raise RuntimeError(f'Benchmark ingest failed: {response.status_code} {getattr(response, "data", "")}')
+    return elapsed
+
+
+def run(rows, seed=0, repeat=5, predictions=5, sequential=20):
+    """
+    Load `rows` synthetic readings through `upload_csv` and time the hot
+    endpoints. Set `predictions=0` to skip the model-backed metrics;
+    `predict_sequential_ms` is `sequential` single predictions in a row
+    (there is no batch prediction endpoint).
+    """
+    client = _client()
+    memory_start = _reset_peak_memory()
+    elapsed = _upload(client, rows, seed)
+
+    last_page = max(1, math.ceil(rows / settings.REST_FRAMEWORK['PAGE_SIZE']))
+    metrics = {
+        'ingest_rows_per_s': round(rows / elapsed, 1),
+        'list_first_page_ms': _median_ms(lambda: client.get('/api/sensors/'), repeat),
+        'list_last_page_ms': _median_ms(lambda: client.get(f'/api/sensors/?page={last_page}'), repeat),
+        'statistics_ms': _median_ms(lambda: client.get('/api/sensors/statistics/'), repeat),
+        'dashboard_stats_ms': _median_ms(lambda: client.get('/api/alerts/dashboard_stats/'), repeat),
+        # Ingest and queries only; model loading for predictions comes after.
+        'peak_memory_mb': _peak_memory_mb(memory_start),
+    }
+
+    if predictions:
+        sample = generate_readings(sequential, seed).to_dict('records')
+
+        def predict(row):
+            return client.post('/api/predict-risk/', row, format='json')
+
+        metrics['predict_single_ms'] = _median_ms(lambda: predict(sample[0]), predictions)
+        started = time.perf_counter()
+        for row in sample:
+            if predict(row).status_code != 200:
+                raise RuntimeError('Benchmark prediction failed')
+        metrics['predict_sequential_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+    return {
+        'rows': rows,
+        'seed': seed,
+        'repeat': repeat,
+        'sequential': sequential,
+        'metrics': {name: value for name, value in metrics.items() if value is not None},
+    }
+
+
+def run_read_during_ingest(rows, seed=0, readers=4):
+    """
+    Upload `rows` synthetic readings while `readers` threads keep requesting
+    the dashboard endpoints, and report ingest throughput plus the readers'
+    latency percentiles and failed requests. Readers bypass the response
+    cache, so every request reaches the database.
+    """
+    _client()  # create the user before the readers start
+    stop = threading.Event()
+    lock = threading.Lock()
+    timings = []
+    errors = []
+
+    def reader():
+        client = _client()
+        try:
+            while not stop.is_set():
+                for path in READ_DURING_INGEST_PATHS:
+                    cache.clear()
+                    started = time.perf_counter()
+                    try:
+                        ok = client.get(path).status_code == 200
+                    except Exception:
+                        ok = False
+                    with lock:
+                        timings.append((time.perf_counter() - started) * 1000)
+                        if not ok:
+                            errors.append(path)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=reader, daemon=True) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    try:
+        elapsed = _upload(_client(), rows, seed)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    ordered = sorted(timings)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)], 3) if ordered else None
+
+    metrics = {
+        'concurrent_ingest_rows_per_s': round(rows / elapsed, 1),
+        'read_during_ingest_p50_ms': percentile(50),
+        'read_during_ingest_p95_ms': percentile(95),
+        'read_during_ingest_errors': len(errors),
+    }
+    return {'metrics': {name: value for name, value in metrics.items() if value is not None}, 'reads': len(ordered)}
+
+
+# ==================== BASELINES ====================
+
+def baseline_path(label):
+    return BASELINE_DIR / f'baseline-{label}.json'
+
+
+def load_baseline(label):
+    path = baseline_path(label)
+    if not path.exists():
+        return None
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def save_baseline(label, result):
+    BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+    with open(baseline_path(label), 'w') as handle:
+        json.dump(result, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+
+def compare(result, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return one message per metric that regressed by more than `threshold`"""
+    regressions = []
+    for name, value in result['metrics'].items():
+        previous = baseline.get('metrics', {}).get(name)
+        if previous is None or name not in METRICS:
+            continue
+        unit, better = METRICS[name]
+        if better == 'higher':
+            regressed = value < previous * (1 - threshold)
+        else:
+            regressed = value > previous * (1 + threshold)
+        regressed = regressed and abs(value - previous) > NOISE_FLOOR.get(unit, 0)
+        if regressed:
+            change = (value - previous) / previous * 100 if previous else float('inf')
+            regressions.append(f'{name}: {value} {unit} vs baseline {previous} {unit} ({change:+.1f}%)')
+    return regressions
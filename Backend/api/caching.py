@@ -0,0 +1,139 @@
+"""
+Conditional GET and version-keyed response caching.
+
+Every write bumps a per-scope counter in `DataVersion`: saving or
+deleting a `SensorReading` or `Alert` anywhere (API, admin, shell) does
+so from model signals once the transaction commits, and bulk paths that
+bypass signals (ingest, retention, truncation) call `bump` themselves. Read
+endpoints decorated with `cached_read` derive their ETag/Last-Modified
+from those counters, answer `304 Not Modified` without touching the
+queryset, and keep rendered JSON bodies in the Django cache keyed by the
+version token, so a bump makes every stale entry unreachable.
+"""
+import hashlib
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import db
+from .models import Alert, DataVersion, SensorReading
+
+SENSORS = 'sensors'
+ALERTS = 'alerts'
+
+CACHE_PREFIX = 'api:response'
+CACHE_TIMEOUT = 300
+
+
+def bump(*scopes):
+    """Mark the given scopes as changed. Call after the write is committed."""
+    now = timezone.now()
+    with db.serialized_write():
+        for scope in scopes:
+            updated = DataVersion.objects.filter(scope=scope).update(version=F('version') + 1, updated_at=now)
+            if not updated:
+                DataVersion.objects.create(scope=scope, version=1, updated_at=now)
+
+
+@receiver(post_save, sender=SensorReading)
+@receiver(post_delete, sender=SensorReading)
+def _reading_changed(sender, using, **kwargs):
+    transaction.on_commit(lambda: bump(SENSORS), using=using)
+
+
+@receiver(post_save, sender=Alert)
+@receiver(post_delete, sender=Alert)
+def _alert_changed(sender, using, **kwargs):
+    transaction.on_commit(lambda: bump(ALERTS), using=using)
+
+
+def current(scopes):
+    """Return (token, last_modified) for a set of scopes in a single query"""
+    rows = {row.scope: row for row in DataVersion.objects.filter(scope__in=scopes)}
+    parts = []
+    last_modified = None
+    for scope in scopes:
+        row = rows.get(scope)
+        if row is None:
+            parts.append('0')
+            continue
+        # The timestamp keeps tokens unique across database resets, where
+        # counters would otherwise start again from zero.
+        parts.append(f'{row.version}.{int(row.updated_at.timestamp() * 1000)}')
+        if last_modified is None or row.updated_at > last_modified:
+            last_modified = row.updated_at
+    return '-'.join(parts), last_modified
+
+
+def _not_modified(request, etag, last_modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags or f'W/{etag}' in etags
+
+    if_modified_since = request.headers.get('If-Modified-Since')
+    if if_modified_since and last_modified is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and int(last_modified.timestamp()) <= since
+    return False
+
+
+def _set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Clients may keep the body but must revalidate before reusing it.
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def cached_read(*scopes):
+    """
+    Decorate a viewset GET handler with ETag/Last-Modified validation and
+    a shared response cache keyed by the data version of `scopes`.
+
+    Runs after DRF's authentication and permission checks, so a 304 or a
+    cache hit is only ever served to a caller allowed to see the data.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return method(self, request, *args, **kwargs)
+
+            token, last_modified = current(scopes)
+            etag = f'"{token}"'
+            if _not_modified(request, etag, last_modified):
+                return _set_validators(Response(status=status.HTTP_304_NOT_MODIFIED), etag, last_modified)
+
+            # Only JSON bodies are shared; the browsable API embeds the user.
+            renderer = getattr(request, 'accepted_renderer', None)
+            if renderer is None or renderer.format != 'json':
+                return _set_validators(method(self, request, *args, **kwargs), etag, last_modified)
+
+            path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+            key = f'{CACHE_PREFIX}:{token}:{request.accepted_media_type}:{path}'
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return _set_validators(HttpResponse(content, content_type=content_type), etag, last_modified)
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                def store(rendered):
+                    cache.set(key, (rendered.content, rendered['Content-Type']), CACHE_TIMEOUT)
+                response.add_post_render_callback(store)
+            return _set_validators(response, etag, last_modified)
+        return wrapper
+    return decorator
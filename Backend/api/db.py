@@ -0,0 +1,68 @@
+"""
+SQLite connection setup and read/write routing.
+
+Every new SQLite connection gets the pragmas in SQLITE_PRAGMAS. WAL lets
+readers keep working while a write transaction is open, so dashboard reads
+no longer wait for a long `upload_csv`. Connections are kept open between
+requests (CONN_MAX_AGE).
+
+`ReadWriteRouter` sends writes to the `default` alias and reads to the
+`read` alias, which opens the same database file as separate, query-only
+connections. Reads issued inside a transaction on `default` stay on
+`default` so they see that transaction's own writes.
+
+SQLite allows one writer at a time. Every transaction on `default` opens
+with BEGIN IMMEDIATE (OPTIONS['transaction_mode'], see api/backends), so
+it takes the write lock before its first read, and writers in other
+processes wait up to OPTIONS['timeout'] for it instead of failing with
+"database is locked". Bulk writes also go through `serialized_write`,
+which queues them on a process-wide lock so writers in this process wait
+their turn without spending that timeout.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+WRITE_DB = 'default'
+READ_DB = 'read'
+
+_write_lock = threading.RLock()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        if connection.alias == READ_DB:
+            cursor.execute('PRAGMA query_only = ON')
+
+
+class ReadWriteRouter:
+    def db_for_read(self, model, **hints):
+        if READ_DB not in connections.settings or connections[WRITE_DB].in_atomic_block:
+            return WRITE_DB
+        return READ_DB
+
+    def db_for_write(self, model, **hints):
+        return WRITE_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == WRITE_DB
+
+
+@contextmanager
+def serialized_write(using=WRITE_DB):
+    """One write transaction at a time in this process, holding SQLite's write lock"""
+    with _write_lock, transaction.atomic(using=using):
+        yield
+
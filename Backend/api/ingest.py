@@ -0,0 +1,445 @@
+"""
+Streaming, idempotent ingest of sensor CSV exports.
+
+`open_csv` wraps an uploaded or assembled file in a text stream,
+decompressing `.csv.gz` and `.zip` inputs on the fly, and `ingest` reads it
+row by row in chunks of INGEST_CHUNK_ROWS. Nothing holds more than one
+chunk in memory, so file size is bounded by disk, not RAM.
+
+Readings are unique on (sensor_id, timestamp). Each chunk is inserted with
+conflict-ignoring bulk inserts inside one serialized write transaction, so
+re-sending a file, or the overlap of a resumed one, only counts duplicates
+and creates nothing. Keys are also checked against the retention archive,
+which the table's unique constraint does not cover. Values the columns
+cannot hold are rejected per row while parsing.
+
+Large files can also arrive as an `UploadSession`: the client sends chunks
+at explicit byte offsets with a SHA-256 per chunk, asks for the stored
+offset to resume after a failure, and completes the session to ingest the
+assembled file.
+"""
+import csv
+import gzip
+import hashlib
+import io
+import logging
+import os
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from http import HTTPStatus
+from datetime import datetime
+from decimal import Context, Decimal, InvalidOperation
+from itertools import islice
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.utils import timezone
+
+from . import caching, db, metrics, retention, spatial
+from .models import Alert, SensorReading, UploadSession
+
+logger = logging.getLogger(__name__)
+
+INGEST_CHUNK_ROWS = 1000
+ERROR_SAMPLES = 10
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y']
+SUPPORTED_EXTENSIONS = ('.csv', '.csv.gz', '.zip')
+COPY_BLOCK_BYTES = 1024 * 1024
+
+try:
+    import fcntl
+except ImportError:  # Windows: serialize chunk writes within this process only
+    fcntl = None
+_PART_LOCK = threading.Lock()
+
+
+class UnsupportedFile(ValueError):
+    pass
+
+
+# Raised while reading a damaged or mislabelled upload
+INPUT_ERRORS = (UnsupportedFile, zipfile.BadZipFile, gzip.BadGzipFile, EOFError, UnicodeDecodeError, csv.Error)
+
+
+def is_supported(name):
+    return name.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def open_csv(fileobj, name):
+    """Text stream over a .csv, .csv.gz or .zip (first .csv member) file object"""
+    lower = name.lower()
+    if lower.endswith('.zip'):
+        archive = zipfile.ZipFile(fileobj)
+        members = [info for info in archive.infolist() if info.filename.lower().endswith('.csv') and not info.is_dir()]
+        if not members:
+            raise UnsupportedFile('Zip archive contains no .csv file')
+        raw = archive.open(members[0])
+    elif lower.endswith('.csv.gz'):
+        raw = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    elif lower.endswith('.csv'):
+        raw = fileobj
+    else:
+        raise UnsupportedFile('File must be .csv, .csv.gz or .zip')
+    return io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(COPY_BLOCK_BYTES), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ==================== PARSING ====================
+
+def _decimal(value):
+    if not value or value.strip() == '':
+        return Decimal('0')
+    return Decimal(value)
+
+
+def _int(value):
+    if not value or value.strip() == '':
+        return 0
+    return int(float(value))
+
+
+def _bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ['true', '1', 'yes']
+    return bool(int(value))
+
+
+def parse_timestamp(value):
+    value = value.strip()
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return timezone.make_aware(datetime.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise ValueError(f"Cannot parse timestamp: {value}")
+
+
+def check_ranges(reading):
+    """
+    Raise ValueError for values the columns cannot store: decimals too wide
+    for max_digits/decimal_places, and negative positive-integer fields.
+    Caught here, they are reported per row instead of failing the whole
+    chunk's insert.
+    """
+    for field in SensorReading._meta.concrete_fields:
+        value = getattr(reading, field.attname)
+        if value is None:
+            continue
+        internal = field.get_internal_type()
+        if internal == 'DecimalField':
+            try:
+                if not value.is_finite():
+                    raise InvalidOperation
+                # The same rounding the ORM applies when saving.
+                value.quantize(Decimal(1).scaleb(-field.decimal_places),
+                               context=Context(prec=field.max_digits, traps=[InvalidOperation]))
+            except InvalidOperation:
+                raise ValueError(f'{field.name}={value} does not fit {field.max_digits} digits '
+                                 f'with {field.decimal_places} decimal places')
+        elif internal.startswith('Positive') and value < 0:
+            raise ValueError(f'{field.name}={value} must not be negative')
+
+
+def parse_row(row):
+    """Unsaved, range-checked SensorReading from one upload-CSV row"""
+    reading = SensorReading(
+        timestamp=parse_timestamp(row['timestamp']),
+        year=_int(row['year']),
+        month=_int(row['month']),
+        day_of_year=_int(row['day_of_year']),
+        hour=_int(row['hour']),
+        shift=row['shift'].strip(),
+        sensor_id=row['sensor_id'].strip(),
+        latitude=_decimal(row['latitude']),
+        longitude=_decimal(row['longitude']),
+        elevation_ft=_decimal(row['elevation_ft']),
+        weather_station_id=row['weather_station_id'].strip(),
+        sensor_status=row['sensor_status'].strip(),
+        data_quality_flag=row['data_quality_flag'].strip(),
+        temperature_f=_decimal(row['temperature_f']),
+        precipitation_in=_decimal(row['precipitation_in']),
+        humidity_pct=_decimal(row['humidity_pct']),
+        wind_speed_mph=_decimal(row['wind_speed_mph']),
+        barometric_pressure_inhg=_decimal(row['barometric_pressure_inhg']),
+        slope_zone=row['slope_zone'].strip(),
+        slope_angle_deg=_decimal(row['slope_angle_deg']),
+        bench_height_ft=_decimal(row['bench_height_ft']),
+        rock_type=row['rock_type'].strip().upper(),
+        rock_mass_rating=_int(row['rock_mass_rating']),
+        joint_spacing_ft=_decimal(row['joint_spacing_ft']),
+        joint_orientation_deg=_decimal(row['joint_orientation_deg']),
+        depth_to_water_ft=_decimal(row['depth_to_water_ft']),
+        pore_pressure_psi=_decimal(row['pore_pressure_psi']),
+        blast_frequency_7days=_int(row['blast_frequency_7days']),
+        distance_to_blast_ft=_decimal(row['distance_to_blast_ft']),
+        blast_magnitude_lbs=_decimal(row['blast_magnitude_lbs']),
+        equipment_passes_per_shift=_int(row['equipment_passes_per_shift']),
+        microseismic_events_daily=_int(row['microseismic_events_daily']),
+        max_seismic_magnitude=_decimal(row['max_seismic_magnitude']),
+        displacement_rate_mm_per_day=_decimal(row['displacement_rate_mm_per_day']),
+        cumulative_displacement_mm=_decimal(row['cumulative_displacement_mm']),
+        tiltmeter_microradians=_decimal(row['tiltmeter_microradians']),
+        strain_gauge_microstrain=_decimal(row['strain_gauge_microstrain']),
+        vibration_ppv_mm_per_s=_decimal(row['vibration_ppv_mm_per_s']),
+        rockfall_risk_score=_decimal(row['rockfall_risk_score']),
+        rockfall_occurred=_bool(row['rockfall_occurred']),
+        rockfall_size_category=row['rockfall_size_category'].strip(),
+    )
+    check_ranges(reading)
+    return reading
+
+
+def alert_for(reading):
+    """The alert an ingested reading raises, if any"""
+    risk_score = float(reading.rockfall_risk_score)
+    if risk_score < 50:
+        return None
+    return Alert(
+        alert_id=f'ALERT-{reading.sensor_id}-{reading.pk}',
+        sensor_reading=reading,
+        alert_type='CRITICAL' if risk_score >= 75 else 'HIGH',
+        status='ACTIVE',
+        zone_name=reading.slope_zone,
+        risk_score=reading.rockfall_risk_score,
+        recommended_action='Monitor closely and restrict access.',
+    )
+
+
+# ==================== WRITING ====================
+
+def _stored_keys(readings):
+    """{(sensor_id, timestamp): id} already stored for the chunk's sensors and time span"""
+    sensors = {reading.sensor_id for reading in readings}
+    timestamps = [reading.timestamp for reading in readings]
+    rows = SensorReading.objects.filter(
+        sensor_id__in=sensors, timestamp__gte=min(timestamps), timestamp__lte=max(timestamps),
+    ).values_list('sensor_id', 'timestamp', 'id')
+    return {(sensor_id, timestamp): pk for sensor_id, timestamp, pk in rows}
+
+
+def write_chunk(readings, archived=None):
+    """
+    Insert the readings that are not stored yet, with their alerts, and
+    update the spatial index. Returns the readings that were new.
+    `archived` (a `retention.ArchivedKeys`) can be shared across chunks.
+    """
+    if not readings:
+        return []
+    if archived is None:
+        archived = retention.ArchivedKeys()
+    unique = {}
+    for reading in readings:
+        key = (reading.sensor_id, reading.timestamp)
+        if key not in archived:
+            unique.setdefault(key, reading)
+
+    with db.serialized_write():
+        before = _stored_keys(readings)
+        fresh = [reading for key, reading in unique.items() if key not in before]
+        if not fresh:
+            return []
+        SensorReading.objects.bulk_create(fresh, batch_size=500, ignore_conflicts=True)
+
+        # ignore_conflicts inserts don't report ids; read them back by key.
+        after = _stored_keys(fresh)
+        created = []
+        for reading in fresh:
+            reading.pk = after.get((reading.sensor_id, reading.timestamp))
+            if reading.pk is not None:
+                created.append(reading)
+
+        alerts = [alert for alert in map(alert_for, created) if alert is not None]
+        Alert.objects.bulk_create(alerts, batch_size=500, ignore_conflicts=True)
+        spatial.index_readings(created)
+        caching.bump(caching.SENSORS, caching.ALERTS)
+    return created
+
+
+def ingest(text_stream):
+    """Parse and store a CSV text stream; returns the counts `upload_csv` reports"""
+    result = {'created': 0, 'duplicates': 0, 'errors': 0, 'error_samples': []}
+    rows = enumerate(csv.DictReader(text_stream), start=2)
+    archived = retention.ArchivedKeys()
+
+    while True:
+        chunk = list(islice(rows, INGEST_CHUNK_ROWS))
+        if not chunk:
+            break
+        started = time.perf_counter()
+
+        readings, row_nums = [], []
+        for row_num, row in chunk:
+            try:
+                readings.append(parse_row(row))
+                row_nums.append(row_num)
+            except KeyError as e:
+                _error(result, f"Row {row_num}: Missing column {str(e)}")
+            except Exception as e:
+                _error(result, f"Row {row_num}: {type(e).__name__} - {str(e)}")
+
+        failed = 0
+        try:
+            created = write_chunk(readings, archived)
+        except (DatabaseError, ArithmeticError):
+            # A row the checks above missed; the chunk was rolled back, so
+            # store its rows one at a time and report only the bad ones.
+            created = []
+            for row_num, reading in zip(row_nums, readings):
+                try:
+                    created += write_chunk([reading], archived)
+                except (DatabaseError, ArithmeticError) as e:
+                    failed += 1
+                    _error(result, f"Row {row_num}: {type(e).__name__} - {str(e)}")
+        result['created'] += len(created)
+        result['duplicates'] += len(readings) - failed - len(created)
+        if created:
+            metrics.record_ingest_chunk(len(created), time.perf_counter() - started)
+
+    result['total_processed'] = result['created'] + result['duplicates'] + result['errors']
+    if not result['error_samples']:
+        del result['error_samples']
+    return result
+
+
+def _error(result, message):
+    result['errors'] += 1
+    if len(result['error_samples']) < ERROR_SAMPLES:
+        result['error_samples'].append(message)
+    logger.warning(message)
+
+
+# ==================== CHUNKED UPLOADS ====================
+
+class UploadError(Exception):
+    status_code = HTTPStatus.BAD_REQUEST
+
+
+class OffsetMismatch(UploadError):
+    status_code = HTTPStatus.CONFLICT
+
+
+class ChunkTooLarge(UploadError):
+    status_code = HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+
+def part_path(session):
+    return settings.UPLOAD_ROOT / f'{session.pk}.part'
+
+
+def _sha256_of_range(path, offset, length):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        handle.seek(offset)
+        while length > 0:
+            block = handle.read(min(COPY_BLOCK_BYTES, length))
+            if not block:
+                break
+            digest.update(block)
+            length -= len(block)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _locked_part(path):
+    """The part file, opened for writing and held exclusively by this request."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    handle = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT), 'r+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            yield handle
+        else:
+            with _PART_LOCK:
+                yield handle
+    finally:
+        handle.close()
+
+
+def append_chunk(session, offset, length, checksum, stream):
+    """
+    Store `length` bytes read from `stream` at `offset` and return the new
+    stored size. A chunk that was already stored with the same checksum
+    (a retry after a lost response) is accepted without writing.
+    """
+    checksum = checksum.strip().lower()
+    if length > settings.UPLOAD_CHUNK_BYTES:
+        raise ChunkTooLarge(f'Chunks are limited to {settings.UPLOAD_CHUNK_BYTES} bytes')
+    if session.total_size is not None and offset + length > session.total_size:
+        raise UploadError('Chunk runs past the declared file size')
+
+    path = part_path(session)
+    with _locked_part(path) as handle:
+        # Concurrent PUTs queue on the lock; each re-reads the offset the
+        # previous one stored before deciding whether to write.
+        session.refresh_from_db(fields=['status', 'received_bytes'])
+        if session.status != 'OPEN':
+            raise OffsetMismatch('Upload is already complete')
+        if offset + length <= session.received_bytes:
+            if _sha256_of_range(path, offset, length) != checksum:
+                raise OffsetMismatch('A different chunk is already stored at this offset')
+            return session.received_bytes
+        if offset != session.received_bytes:
+            raise OffsetMismatch(f'Expected offset {session.received_bytes}')
+
+        digest = hashlib.sha256()
+        remaining = length
+        handle.seek(offset)
+        handle.truncate()
+        while remaining > 0:
+            block = stream.read(min(COPY_BLOCK_BYTES, remaining))
+            if not block:
+                break
+            digest.update(block)
+            handle.write(block)
+            remaining -= len(block)
+        if remaining or digest.hexdigest() != checksum:
+            handle.truncate(offset)
+            raise UploadError('Chunk is incomplete' if remaining else 'Chunk checksum does not match')
+        handle.flush()
+        os.fsync(handle.fileno())
+
+        # complete_upload and discard_upload do not take the lock.
+        moved = UploadSession.objects.filter(pk=session.pk, status='OPEN', received_bytes=offset).update(
+            received_bytes=offset + length, updated_at=timezone.now(),
+        )
+        if not moved:
+            handle.truncate(offset)
+            raise OffsetMismatch('Upload changed concurrently')
+    session.received_bytes = offset + length
+    return offset + length
+
+
+def complete_upload(session):
+    """Verify the assembled file, ingest it and drop the part file; repeat calls return the stored result"""
+    if session.status == 'COMPLETE':
+        return session.result
+    if session.total_size is not None and session.received_bytes != session.total_size:
+        raise UploadError(f'Received {session.received_bytes} of {session.total_size} bytes')
+
+    path = part_path(session)
+    if not path.exists():
+        raise UploadError('No data received')
+    if session.sha256 and file_sha256(path) != session.sha256.strip().lower():
+        raise UploadError('File checksum does not match; restart the upload')
+
+    with open(path, 'rb') as handle:
+        result = ingest(open_csv(handle, session.filename))
+
+    session.status = 'COMPLETE'
+    session.result = result
+    session.save(update_fields=['status', 'result', 'updated_at'])
+    path.unlink(missing_ok=True)
+    return result
+
+
+def discard_upload(session):
+    part_path(session).unlink(missing_ok=True)
@@ -0,0 +1,222 @@
+"""
+Sensor feed replay and load generation.
+
+`replay` plays a CSV of readings back against a running API the way a
+mine would produce it: readings sharing a timestamp arrive together as
+one `upload_csv` micro-batch, scheduled at `speed`x real time, a share
+of them is scored through `predict-risk`, optional blast bursts send
+extra readings for a tick at once (the same sensors, a few seconds
+apart, as they report faster after a blast), and dashboard pollers hit
+the list and stats endpoints with ETags the whole time.
+
+Requests are scheduled with asyncio and executed on a thread pool with
+pooled `requests` sessions; `concurrency` bounds the in-flight ingest
+and prediction calls.
+"""
+import asyncio
+import csv
+import io
+import math
+import random
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+
+TIMESTAMP_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y']
+
+POLL_ENDPOINTS = [
+    ('sensors', '/sensors/'),
+    ('alerts', '/alerts/'),
+    ('statistics', '/sensors/statistics/'),
+    ('dashboard_stats', '/alerts/dashboard_stats/'),
+]
+
+
+def _parse_timestamp(value):
+    for fmt in TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f'Cannot parse timestamp: {value}')
+
+
+def ticks_from_rows(rows):
+    """Group rows by timestamp into (seconds since first reading, rows) in time order"""
+    groups = defaultdict(list)
+    for row in rows:
+        groups[_parse_timestamp(row['timestamp'])].append(row)
+    if not groups:
+        return []
+    start = min(groups)
+    return [((moment - start).total_seconds(), groups[moment]) for moment in sorted(groups)]
+
+
+def burst_rows(rows, copy):
+    """The tick's rows as distinct readings `copy` seconds later"""
+    burst = []
+    for row in rows:
+        moment = _parse_timestamp(row['timestamp']) + timedelta(seconds=copy)
+        burst.append(dict(row, timestamp=moment.strftime(TIMESTAMP_FORMATS[0])))
+    return burst
+
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as handle:
+        reader = csv.DictReader(handle)
+        return reader.fieldnames, list(reader)
+
+
+def _to_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=header)
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = defaultdict(int)
+
+    def record(self, seconds, status):
+        self.latencies.append(seconds)
+        self.statuses[status] += 1
+        if status is None or status >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed):
+        count = len(self.latencies)
+        ordered = sorted(self.latencies)
+
+        def percentile(p):
+            if not ordered:
+                return None
+            return round(ordered[min(count - 1, math.ceil(p / 100 * count) - 1)] * 1000, 2)
+
+        return {
+            'requests': count,
+            'throughput_rps': round(count / elapsed, 2) if elapsed else None,
+            'error_rate': round(self.errors / count, 4) if count else 0.0,
+            'p50_ms': percentile(50),
+            'p90_ms': percentile(90),
+            'p99_ms': percentile(99),
+            'mean_ms': round(statistics.fmean(ordered) * 1000, 2) if ordered else None,
+            'statuses': {str(status): n for status, n in sorted(self.statuses.items(), key=lambda item: str(item[0]))},
+        }
+
+
+class Replayer:
+    def __init__(self, base_url, token, concurrency=16, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.stats = defaultdict(EndpointStats)
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers['Authorization'] = f'Bearer {self.token}'
+        return session
+
+    def _send(self, method, path, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self._session().request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            status = response.status_code
+        except requests.RequestException:
+            response, status = None, None
+        return response, status, time.perf_counter() - started
+
+    async def call(self, name, method, path, limit=True, **kwargs):
+        loop = asyncio.get_running_loop()
+        if limit:
+            async with self._semaphore:
+                response, status, seconds = await loop.run_in_executor(
+                    self._executor, lambda: self._send(method, path, **kwargs))
+        else:
+            response, status, seconds = await loop.run_in_executor(
+                self._executor, lambda: self._send(method, path, **kwargs))
+        self.stats[name].record(seconds, status)
+        return response
+
+    async def ingest(self, header, rows):
+        payload = _to_csv(header, rows)
+        await self.call('upload_csv', 'POST', '/sensors/upload_csv/',
+                        files={'file': ('replay.csv', payload, 'text/csv')})
+
+    async def predict(self, row):
+        await self.call('predict_risk', 'POST', '/predict-risk/', json=row)
+
+    async def poll(self, interval, stop):
+        etags = {}
+        while not stop.is_set():
+            for name, path in POLL_ENDPOINTS:
+                headers = {'If-None-Match': etags[name]} if name in etags else {}
+                response = await self.call(name, 'GET', path, limit=False, headers=headers)
+                if response is not None and response.headers.get('ETag'):
+                    etags[name] = response.headers['ETag']
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, header, ticks, speed, predict_ratio=0.1, pollers=4, poll_interval=2.0,
+                  burst_every=0, burst_multiplier=5, duration=None, seed=0):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency + pollers)
+        rng = random.Random(seed)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+
+        started = loop.time()
+        poll_tasks = [asyncio.create_task(self.poll(poll_interval, stop)) for _ in range(pollers)]
+        in_flight = set()
+        try:
+            for index, (offset, rows) in enumerate(ticks):
+                due = started + offset / speed
+                if duration is not None and due - started > duration:
+                    break
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                copies = burst_multiplier if burst_every and index and index % burst_every == 0 else 1
+                in_flight.add(asyncio.create_task(self.ingest(header, rows)))
+                for copy in range(1, copies):
+                    in_flight.add(asyncio.create_task(self.ingest(header, burst_rows(rows, copy))))
+                for row in rows:
+                    if rng.random() < predict_ratio:
+                        in_flight.add(asyncio.create_task(self.predict(row)))
+                in_flight = {task for task in in_flight if not task.done()}
+
+            if in_flight:
+                await asyncio.gather(*in_flight)
+        finally:
+            stop.set()
+            await asyncio.gather(*poll_tasks)
+            self._executor.shutdown(wait=True)
+
+        elapsed = loop.time() - started
+        return {
+            'elapsed_s': round(elapsed, 3),
+            'ticks': len(ticks),
+            'endpoints': {name: stats.summary(elapsed) for name, stats in sorted(self.stats.items())},
+        }
+
+
+def login(base_url, email, password, role):
+    response = requests.post(f'{base_url.rstrip("/")}/auth/login/',
+                             json={'email': email, 'password': password, 'role': role}, timeout=30)
+    response.raise_for_status()
+    return response.json()['tokens']['access']
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api import retention
+
+
+class Command(BaseCommand):
+    help = 'Move sensor readings older than the retention window into the compressed archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Keep this many days hot (default: settings.RETENTION_DAYS)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report what would be archived')
+
+    def handle(self, *args, **options):
+        summary = retention.apply(days=options['days'], dry_run=options['dry_run'])
+
+        for partition in summary['partitions']:
+            self.stdout.write(f"{partition['month']}  {partition['zone']}: {partition['rows']} readings")
+
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {summary['archived']} readings older than {summary['cutoff']:%Y-%m-%d %H:%M} "
+            f"and {summary['alerts_archived']} resolved alerts into {summary['files']} files"
+        ))
@@ -0,0 +1,74 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from api import benchmarks, retention
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ingest, list, statistics and prediction paths on synthetic data in a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10k',
+                            help='Comma-separated dataset sizes, e.g. 10k,100k,1M (default: 10k)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed repetitions per read endpoint; the median is reported')
+        parser.add_argument('--predictions', type=int, default=5,
+                            help='Single-prediction repetitions; 0 skips the model-backed metrics')
+        parser.add_argument('--sequential', type=int, default=20,
+                            help='Predictions sent one after another in the sequential measurement')
+        parser.add_argument('--readers', type=int, default=4,
+                            help='Reader threads for the read-during-ingest run; 0 skips it')
+        parser.add_argument('--threshold', type=float, default=benchmarks.DEFAULT_THRESHOLD,
+                            help='Allowed relative regression against the baseline (default: 0.25)')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store the results as the new baselines instead of comparing')
+        parser.add_argument('--output', help='Also write all results to this JSON file')
+
+    def handle(self, *args, **options):
+        sizes = [(label.strip(), benchmarks.parse_size(label.strip())) for label in options['sizes'].split(',')]
+
+        results = {}
+        # DEBUG would keep every executed query in memory.
+        with benchmarks.throwaway_database(), override_settings(DEBUG=False):
+            for label, rows in sizes:
+                self.stdout.write(f'Benchmarking {label} ({rows} readings)...')
+                retention.truncate()
+                results[label] = benchmarks.run(
+                    rows,
+                    seed=options['seed'],
+                    repeat=options['repeat'],
+                    predictions=options['predictions'],
+                    sequential=options['sequential'],
+                )
+                if options['readers']:
+                    retention.truncate()
+                    concurrent = benchmarks.run_read_during_ingest(rows, seed=options['seed'], readers=options['readers'])
+                    results[label]['metrics'].update(concurrent['metrics'])
+                    results[label]['readers'] = options['readers']
+                for name, value in results[label]['metrics'].items():
+                    self.stdout.write(f'  {name:<28} {value:>12} {benchmarks.METRICS[name][0]}')
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2, sort_keys=True)
+
+        if options['save_baseline']:
+            for label, result in results.items():
+                benchmarks.save_baseline(label, result)
+                self.stdout.write(self.style.SUCCESS(f'Saved baseline {benchmarks.baseline_path(label)}'))
+            return
+
+        failures = []
+        for label, result in results.items():
+            baseline = benchmarks.load_baseline(label)
+            if baseline is None:
+                self.stdout.write(self.style.WARNING(f'No baseline for {label}; run with --save-baseline'))
+                continue
+            failures += [f'[{label}] {message}' for message in benchmarks.compare(result, baseline, options['threshold'])]
+
+        if failures:
+            raise CommandError('Performance regressions:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('No regressions'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api import spatial
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the sensor location grid index from the newest reading of every sensor'
+
+    def handle(self, *args, **options):
+        indexed = spatial.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} sensors'))
@@ -0,0 +1,110 @@
+import asyncio
+import json
+from pathlib import Path
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.testcases import LiveServerThread
+from django.test.utils import override_settings
+
+from api import benchmarks, loadgen
+from api.authentication import RoleRefreshToken
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = ('Replay a sensor CSV against the ingest, prediction and alert endpoints at a given '
+            'time compression and concurrency, and report per-endpoint throughput and latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv', nargs='?', default=str(settings.BASE_DIR / 'training_data_500.csv'),
+                            help='CSV in the upload format (default: training_data_500.csv)')
+        parser.add_argument('--expand', type=int, default=0,
+                            help='Replay this many synthetic readings generated from the CSV schema instead')
+        parser.add_argument('--speed', type=float, default=3600,
+                            help='Time compression: seconds of sensor time per wall-clock second (default: 3600)')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='Maximum in-flight ingest and prediction requests')
+        parser.add_argument('--predict-ratio', type=float, default=0.1,
+                            help='Share of readings also sent to predict-risk')
+        parser.add_argument('--pollers', type=int, default=4, help='Simulated dashboard clients')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between dashboard polls')
+        parser.add_argument('--burst-every', type=int, default=0,
+                            help='Every N ticks, simulate a post-blast burst (0 disables)')
+        parser.add_argument('--burst-multiplier', type=int, default=5,
+                            help='Readings per sensor in a burst tick, one second apart, sent at once')
+        parser.add_argument('--duration', type=float, default=None, help='Stop scheduling after this many seconds')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--url', help='Base API URL of a running server, e.g. http://localhost:8000/api. '
+                                          'Without it a local test server on a throwaway database is started')
+        parser.add_argument('--email', help='Login for --url')
+        parser.add_argument('--password', help='Password for --url')
+        parser.add_argument('--role', default='ADMIN', help='Role for --url (default: ADMIN)')
+        parser.add_argument('--output', help='Also write the report to this JSON file')
+
+    def handle(self, *args, **options):
+        if options['expand']:
+            frame = benchmarks.generate_readings(options['expand'], options['seed'])
+            header = list(frame.columns)
+            rows = frame.astype(str).to_dict('records')
+        else:
+            header, rows = loadgen.read_csv(options['csv'])
+        ticks = loadgen.ticks_from_rows(rows)
+        if not ticks:
+            raise CommandError('No readings to replay')
+        self.stdout.write(f'Replaying {len(rows)} readings in {len(ticks)} ticks at {options["speed"]:g}x')
+
+        if options['url']:
+            if not (options['email'] and options['password']):
+                raise CommandError('--email and --password are required with --url')
+            try:
+                token = loadgen.login(options['url'], options['email'], options['password'], options['role'])
+            except requests.RequestException as e:
+                raise CommandError(f'Login failed: {e}')
+            report = self._replay(options['url'], token, header, ticks, options)
+        else:
+            report = self._replay_locally(header, ticks, options)
+
+        self._print(report)
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+
+    def _replay(self, base_url, token, header, ticks, options):
+        replayer = loadgen.Replayer(base_url, token, concurrency=options['concurrency'])
+        return asyncio.run(replayer.run(
+            header, ticks, options['speed'],
+            predict_ratio=options['predict_ratio'],
+            pollers=options['pollers'],
+            poll_interval=options['poll_interval'],
+            burst_every=options['burst_every'],
+            burst_multiplier=options['burst_multiplier'],
+            duration=options['duration'],
+            seed=options['seed'],
+        ))
+
+    def _replay_locally(self, header, ticks, options):
+        with benchmarks.throwaway_database(), override_settings(DEBUG=False, ALLOWED_HOSTS=['*']):
+            user = User.objects.create_user(username='replay', email='replay@example.com', role='ADMIN')
+            token = str(RoleRefreshToken.for_user(user).access_token)
+
+            server = LiveServerThread('localhost', lambda handler: handler)
+            server.daemon = True
+            server.start()
+            try:
+                server.is_ready.wait()
+                if server.error:
+                    raise CommandError(f'Test server failed to start: {server.error}')
+                return self._replay(f'http://localhost:{server.port}/api', token, header, ticks, options)
+            finally:
+                server.terminate()
+                server.join()
+
+    def _print(self, report):
+        self.stdout.write(f"\nElapsed {report['elapsed_s']}s over {report['ticks']} ticks\n")
+        self.stdout.write(f"{'endpoint':<18}{'reqs':>7}{'rps':>9}{'err%':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+        for name, summary in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:<18}{summary['requests']:>7}{summary['throughput_rps']:>9}"
+                f"{summary['error_rate'] * 100:>8.2f}{summary['p50_ms']!s:>10}{summary['p90_ms']!s:>10}{summary['p99_ms']!s:>10}"
+            )
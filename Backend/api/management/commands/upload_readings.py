@@ -0,0 +1,97 @@
+import hashlib
+import os
+import time
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+from api import ingest, loadgen
+
+
+class Command(BaseCommand):
+    help = ('Send a .csv, .csv.gz or .zip export to a running server in checksummed chunks, '
+            'resuming where the server left off after failures')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--url', required=True, help='Base API URL, e.g. http://localhost:8000/api')
+        parser.add_argument('--email', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--role', default='ADMIN')
+        parser.add_argument('--session', help='Resume this upload session instead of starting a new one')
+        parser.add_argument('--chunk-size', type=int, help='Bytes per chunk (default: the server maximum)')
+        parser.add_argument('--retries', type=int, default=5, help='Attempts per request before giving up')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f'No such file: {path}')
+        self.base_url = options['url'].rstrip('/')
+        self.retries = options['retries']
+        self.http = requests.Session()
+        try:
+            token = loadgen.login(self.base_url, options['email'], options['password'], options['role'])
+        except requests.RequestException as e:
+            raise CommandError(f'Login failed: {e}')
+        self.http.headers['Authorization'] = f'Bearer {token}'
+
+        size = os.path.getsize(path)
+        if options['session']:
+            session = self._request('GET', f'/uploads/{options["session"]}/')
+        else:
+            session = self._request('POST', '/uploads/', json={
+                'filename': os.path.basename(path),
+                'total_size': size,
+                'sha256': ingest.file_sha256(path),
+            })
+            self.stdout.write(f'Upload session {session["id"]} (resume with --session {session["id"]})')
+        if session['status'] == 'COMPLETE':
+            self._report(session['result'])
+            return
+
+        chunk_size = min(options['chunk_size'] or session['chunk_size'], session['chunk_size'])
+        offset = session['received_bytes']
+        started = time.perf_counter()
+        with open(path, 'rb') as handle:
+            while offset < size:
+                handle.seek(offset)
+                chunk = handle.read(chunk_size)
+                reply = self._request('PUT', f'/uploads/{session["id"]}/chunk/', data=chunk, accept=(409,), retry=(400,), headers={
+                    'Content-Type': 'application/octet-stream',
+                    'X-Upload-Offset': str(offset),
+                    'X-Chunk-SHA256': hashlib.sha256(chunk).hexdigest(),
+                })
+                # On 409 the server reports the offset it actually has; a 400
+                # (checksum mismatch in transit) resends the chunk.
+                offset = reply['offset']
+                self.stdout.write(f'\r{offset}/{size} bytes', ending='')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'\nSent in {elapsed:.1f}s; ingesting...')
+
+        self._report(self._request('POST', f'/uploads/{session["id"]}/complete/'))
+
+    def _request(self, method, path, accept=(), retry=(), **kwargs):
+        """JSON body of a 2xx (or `accept`ed) reply, retrying network errors, 5xx and `retry` statuses with backoff"""
+        for attempt in range(1, self.retries + 1):
+            try:
+                response = self.http.request(method, self.base_url + path, timeout=300, **kwargs)
+            except requests.RequestException as e:
+                error = str(e)
+            else:
+                if response.ok or response.status_code in accept:
+                    return response.json()
+                error = f'{response.status_code} {response.text[:500]}'
+                if response.status_code < 500 and response.status_code not in retry:
+                    break
+            if attempt < self.retries:
+                self.stderr.write(f'{method} {path} failed ({error}); retrying')
+                time.sleep(min(30, 2 ** attempt))
+        raise CommandError(f'{method} {path} failed: {error}')
+
+    def _report(self, result):
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']}, duplicates {result['duplicates']}, errors {result['errors']}"
+        ))
+        for sample in result.get('error_samples', []):
+            self.stdout.write(f'  {sample}')
+
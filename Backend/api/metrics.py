@@ -0,0 +1,258 @@
+"""
+In-process metrics with a Prometheus text exposition.
+
+`MetricsMiddleware` records per-endpoint latency, DB query counts and DB
+time for every request; `timer` / `timed` record anything else (model
+loads, inference, ingest chunks). Values live in this process only, so
+with several workers each one exposes its own series and Prometheus
+aggregates them. `/api/metrics/` takes the METRICS_TOKEN bearer token
+when one is configured and an admin user otherwise.
+
+Admins can send `X-Profile: 1` to get a cProfile summary and the ORM
+query log for that single request instead of its normal body.
+"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+RATE_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ROWS = 40
+
+
+class Registry:
+    """Thread-safe store of counters and histograms keyed by name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """Prometheus text exposition format 0.0.4"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, dict(value, counts=list(value['counts']))) for key, value in self._histograms.items())
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_labels(labels)} {_number(value)}')
+
+        for (name, labels), histogram in histograms:
+            header(name, 'histogram')
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {count}')
+            lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {histogram["count"]}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(histogram["sum"])}')
+            lines.append(f'{name}_count{_labels(labels)} {histogram["count"]}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _number(value):
+    return str(value) if isinstance(value, int) else repr(float(value))
+
+
+registry = Registry()
+
+registry.describe('http_request_duration_seconds', 'Request latency by endpoint.')
+registry.describe('http_requests_total', 'Requests by endpoint and status code.')
+registry.describe('db_queries_per_request', 'ORM queries executed per request.')
+registry.describe('db_query_duration_seconds_total', 'Time spent in DB queries by endpoint.')
+registry.describe('ingest_rows_total', 'Sensor readings ingested.')
+registry.describe('ingest_chunk_rows_per_second', 'Ingest throughput per chunk.')
+registry.describe('model_load_seconds', 'Model load time by model.')
+registry.describe('inference_seconds', 'Prediction latency by model.')
+
+
+@contextmanager
+def timer(name, buckets=LATENCY_BUCKETS, **labels):
+    """Observe the wall time of the block in seconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - started, buckets, **labels)
+
+
+def timed(name, buckets=LATENCY_BUCKETS, **labels):
+    """Decorator form of `timer`"""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(name, buckets, **labels):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_ingest_chunk(rows, seconds):
+    registry.inc('ingest_rows_total', rows)
+    if seconds > 0:
+        registry.observe('ingest_chunk_rows_per_second', rows / seconds, RATE_BUCKETS)
+
+
+# ==================== MIDDLEWARE ====================
+
+class QueryRecorder:
+    """`connection.execute_wrapper` hook counting and timing queries"""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.seconds = 0.0
+        self.keep_sql = keep_sql
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.seconds += elapsed
+            if self.keep_sql:
+                self.queries.append({'sql': sql, 'params': repr(params)[:500], 'ms': round(elapsed * 1000, 3)})
+
+
+@contextmanager
+def _recording(recorder):
+    """Install `recorder` on every database alias (reads go to `read`, writes to `default`)"""
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(recorder))
+        yield
+
+
+def _endpoint(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name
+
+
+def _is_admin(request):
+    """An admin, authenticated by session or JWT"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
+        from .authentication import CachedJWTAuthentication
+        try:
+            result = CachedJWTAuthentication().authenticate(request)
+        except (InvalidToken, AuthenticationFailed):
+            return False
+        user = result[0] if result else None
+    return bool(user and user.is_authenticated and (user.is_superuser or getattr(user, 'role', None) == 'ADMIN'))
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.headers.get(PROFILE_HEADER) and _is_admin(request):
+            return self._profile(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with _recording(recorder):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        endpoint = _endpoint(request)
+        registry.observe('http_request_duration_seconds', elapsed, endpoint=endpoint, method=request.method)
+        registry.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        registry.observe('db_queries_per_request', recorder.count, COUNT_BUCKETS, endpoint=endpoint)
+        registry.inc('db_query_duration_seconds_total', recorder.seconds, endpoint=endpoint)
+        return response
+
+    def _profile(self, request):
+        recorder = QueryRecorder(keep_sql=True)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with _recording(recorder):
+            response = profiler.runcall(self.get_response, request)
+        elapsed = time.perf_counter() - started
+
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_ROWS)
+        report = {
+            'endpoint': _endpoint(request),
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 3),
+            'db_queries': recorder.count,
+            'db_ms': round(recorder.seconds * 1000, 3),
+            'queries': recorder.queries,
+            'profile': stream.getvalue(),
+        }
+        return HttpResponse(json.dumps(report, indent=2), content_type='application/json')
+
+
+# ==================== ENDPOINT ====================
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires METRICS_TOKEN when it is set, an admin otherwise"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponseForbidden('Invalid metrics token\n', content_type='text/plain')
+    if not token and not _is_admin(request):
+        return HttpResponseForbidden('Metrics require an admin or METRICS_TOKEN\n', content_type='text/plain')
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
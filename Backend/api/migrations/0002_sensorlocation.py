@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-19 14:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sensor_id', models.CharField(max_length=50, unique=True)),
+                ('latitude', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('longitude', models.DecimalField(decimal_places=7, max_digits=10)),
+                ('cell_row', models.IntegerField()),
+                ('cell_col', models.IntegerField()),
+                ('slope_zone', models.CharField(max_length=100)),
+                ('rockfall_risk_score', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('timestamp', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('reading', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='api.sensorreading')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cell_row', 'cell_col'], name='sensorloc_cell_idx')],
+            },
+        ),
+    ]
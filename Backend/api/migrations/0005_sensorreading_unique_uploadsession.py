@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-19 15:08
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+def remove_duplicate_readings(apps, schema_editor):
+    """Keep the first of each (sensor_id, timestamp); drop the copies and their alerts"""
+    SensorReading = apps.get_model('api', 'SensorReading')
+    Alert = apps.get_model('api', 'Alert')
+    SensorLocation = apps.get_model('api', 'SensorLocation')
+    quote = schema_editor.connection.ops.quote_name
+    reading, alert, location = (quote(model._meta.db_table) for model in (SensorReading, Alert, SensorLocation))
+
+    duplicates = (
+        f'SELECT r.id FROM {reading} r WHERE EXISTS ('
+        f'SELECT 1 FROM {reading} k WHERE k.sensor_id = r.sensor_id AND k.timestamp = r.timestamp AND k.id < r.id)'
+    )
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {location} SET reading_id = ('
+            f'SELECT MIN(k.id) FROM {reading} k JOIN {reading} r ON k.sensor_id = r.sensor_id AND k.timestamp = r.timestamp '
+            f'WHERE r.id = {location}.reading_id) WHERE reading_id IN ({duplicates})'
+        )
+        cursor.execute(f'DELETE FROM {alert} WHERE sensor_reading_id IN ({duplicates})')
+        cursor.execute(f'DELETE FROM {reading} WHERE id IN ({duplicates})')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_user_email_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255)),
+                ('total_size', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('sha256', models.CharField(blank=True, max_length=64)),
+                ('received_bytes', models.PositiveBigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('OPEN', 'Open'), ('COMPLETE', 'Complete')], default='OPEN', max_length=20)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(remove_duplicate_readings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='sensorreading',
+            constraint=models.UniqueConstraint(fields=('sensor_id', 'timestamp'), name='sensorreading_sensor_ts_uniq'),
+        ),
+        migrations.AddField(
+            model_name='uploadsession',
+            name='created_by',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-19 16:20
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+
+
+def index_existing_readings(apps, schema_editor):
+    """Fill the sensor location index from the newest reading of every sensor, like spatial.rebuild()"""
+    from api.spatial import cell_for
+
+    SensorReading = apps.get_model('api', 'SensorReading')
+    SensorLocation = apps.get_model('api', 'SensorLocation')
+
+    newest = SensorReading.objects.filter(sensor_id=OuterRef('sensor_id')).order_by('-timestamp', '-id')
+    latest_ids = SensorReading.objects.order_by().values('sensor_id').annotate(
+        latest_id=Subquery(newest.values('id')[:1])
+    ).values_list('latest_id', flat=True)
+
+    now = timezone.now()
+    locations = []
+    for reading in SensorReading.objects.filter(id__in=list(latest_ids)):
+        cell_row, cell_col = cell_for(reading.latitude, reading.longitude)
+        locations.append(SensorLocation(
+            sensor_id=reading.sensor_id, reading_id=reading.pk,
+            latitude=reading.latitude, longitude=reading.longitude,
+            cell_row=cell_row, cell_col=cell_col,
+            slope_zone=reading.slope_zone, rockfall_risk_score=reading.rockfall_risk_score,
+            timestamp=reading.timestamp, updated_at=now,
+        ))
+    SensorLocation.objects.all().delete()
+    SensorLocation.objects.bulk_create(locations, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_sensorreading_unique_uploadsession'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing_readings, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -11,6 +13,11 @@ class User(AbstractUser):
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='MANAGER')
     phone_number = models.CharField(max_length=15, blank=True, null=True)
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['email'], name='user_email_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.username} ({self.role})"
 
@@ -85,6 +92,9 @@ class SensorReading(models.Model):
     
     class Meta:
         ordering = ['-timestamp']
+        constraints = [
+            models.UniqueConstraint(fields=['sensor_id', 'timestamp'], name='sensorreading_sensor_ts_uniq'),
+        ]
         
     def __str__(self):
         return f"{self.sensor_id} - {self.timestamp}"
@@ -117,3 +127,60 @@ class Alert(models.Model):
     
     def __str__(self):
         return f"{self.alert_id} - {self.alert_type}"
+
+
+# Sensor Location Index Model
+class SensorLocation(models.Model):
+    """Latest known position of each sensor, bucketed into a lat/lon grid."""
+    sensor_id = models.CharField(max_length=50, unique=True)
+    reading = models.ForeignKey(SensorReading, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    latitude = models.DecimalField(max_digits=10, decimal_places=7)
+    longitude = models.DecimalField(max_digits=10, decimal_places=7)
+    cell_row = models.IntegerField()
+    cell_col = models.IntegerField()
+    slope_zone = models.CharField(max_length=100)
+    rockfall_risk_score = models.DecimalField(max_digits=5, decimal_places=2)
+    timestamp = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['cell_row', 'cell_col'], name='sensorloc_cell_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.sensor_id} @ ({self.cell_row}, {self.cell_col})"
+
+
+# Data Version Model
+class DataVersion(models.Model):
+    """Monotonic change counter per data scope, used for ETags and cache keys."""
+    scope = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
+
+
+# Upload Session Model
+class UploadSession(models.Model):
+    """A resumable chunked upload; bytes are appended to UPLOAD_ROOT/<id>.part."""
+    STATUS_CHOICES = [
+        ('OPEN', 'Open'),
+        ('COMPLETE', 'Complete'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    total_size = models.PositiveBigIntegerField(null=True, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='OPEN')
+    result = models.JSONField(null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes} bytes, {self.status})"
@@ -0,0 +1,54 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when available.
+
+    For compact, unicode responses without float values the output is
+    byte-identical to the stock renderer: datetimes, Decimals and other
+    non-native types are passed through DRF's own JSONEncoder.default,
+    and the \\u2028/\\u2029 escaping is preserved. Floats are not: orjson
+    writes NaN and infinities as null where the stock renderer raises,
+    and formats exponents differently (1e16, not 1e+16). Views opt in
+    per response shape (see SensorReadingViewSet.get_renderers) rather
+    than through DEFAULT_RENDERER_CLASSES.
+
+    Indented output (browsable API, `indent=` media type parameter) and
+    non-default JSON settings fall back to the stock renderer.
+    """
+    _options = (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_PASSTHROUGH_SUBCLASS
+    ) if orjson else 0
+    _default = JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        if (
+            orjson is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context) is not None
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self._default, option=self._options)
+        except (orjson.JSONEncodeError, ValueError):
+            # Non-string keys and other input orjson rejects: let json decide.
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
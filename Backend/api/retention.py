@@ -0,0 +1,493 @@
+"""
+Retention policy and cold archive for sensor readings.
+
+Readings older than `RETENTION_DAYS` are moved out of the hot
+`SensorReading` table into compressed, columnar NumPy archives (one
+`.npz` member per column), partitioned per month and slope zone:
+
+    ARCHIVE_ROOT/readings/2024-01/zone-b/part-000000000001-000000004999.npz
+
+Each part is written under a temporary name, renamed to `.pending`,
+then its rows are deleted from the hot table in short, bounded
+transactions and only then published as `.npz`. A run interrupted
+between those steps is finished by `recover()`, so a row is never in
+the hot table and a published part at the same time.
+
+Readings with an ACTIVE alert stay hot; the alert keeps its full sensor
+reading. Resolved alerts are archived with their reading, in the same
+part under `alert__<column>` members (see `iter_archived_alerts`).
+
+`truncate()` empties the hot tables only; `purge_archive()` removes the
+archive as well (the API's clear_all does both).
+"""
+import datetime
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import caching, db
+from .models import Alert, SensorLocation, SensorReading
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECONDS_PER_DAY = 86400 * 1000000
+
+
+def archive_root():
+    return Path(getattr(settings, 'ARCHIVE_ROOT', settings.BASE_DIR / 'archive')) / 'readings'
+
+
+def chunk_size():
+    return int(getattr(settings, 'RETENTION_CHUNK_SIZE', 2000))
+
+
+def part_rows():
+    return int(getattr(settings, 'ARCHIVE_PART_ROWS', 100000))
+
+
+# ==================== COLUMN LAYOUT ====================
+
+def _fields():
+    return [field for field in SensorReading._meta.concrete_fields]
+
+
+def _alert_fields():
+    return [field for field in Alert._meta.concrete_fields]
+
+
+ALERT_PREFIX = 'alert__'
+
+
+def column_kind(field):
+    internal = field.get_internal_type()
+    if internal == 'DateTimeField':
+        return 'datetime'
+    if internal == 'DecimalField':
+        return 'decimal'
+    if internal == 'BooleanField':
+        return 'bool'
+    if internal in ('CharField', 'TextField'):
+        return 'str'
+    return 'int'
+
+
+def to_micros(value):
+    return (value - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_micros(value):
+    return EPOCH + datetime.timedelta(microseconds=int(value))
+
+
+def encode_columns(rows, fields):
+    """Turn value tuples into one typed NumPy array per column"""
+    columns = {}
+    for index, field in enumerate(fields):
+        values = [row[index] for row in rows]
+        kind = column_kind(field)
+        if kind == 'datetime':
+            columns[field.attname] = np.array([to_micros(v) for v in values], dtype=np.int64)
+        elif kind == 'decimal':
+            # Nulls become NaN; max_digits <= 12 round-trips exactly through float64.
+            columns[field.attname] = np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64)
+        elif kind == 'bool':
+            columns[field.attname] = np.array(values, dtype=bool)
+        elif kind == 'str':
+            columns[field.attname] = np.array(values, dtype=str)
+        else:
+            columns[field.attname] = np.array(values, dtype=np.int64)
+    return columns
+
+
+# ==================== WRITE PATH ====================
+
+def _part_path(month, zone, first_id, last_id):
+    return archive_root() / month.strftime('%Y-%m') / (slugify(zone) or '_') / f'part-{first_id:012d}-{last_id:012d}.npz'
+
+
+def _pending(path):
+    return path.with_suffix('.pending')
+
+
+def _write_part(path, columns):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'wb') as handle:
+        np.savez_compressed(handle, **columns)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(tmp, _pending(path))
+
+
+def _delete_readings(ids):
+    """Delete readings and their alerts by id in bounded transactions, without ORM cascade collection"""
+    table = connection.ops.quote_name(SensorReading._meta.db_table)
+    alert_table = connection.ops.quote_name(Alert._meta.db_table)
+    deleted = 0
+    size = chunk_size()
+    for start in range(0, len(ids), size):
+        chunk = ids[start:start + size]
+        with db.serialized_write():
+            SensorLocation.objects.filter(reading_id__in=chunk).update(reading=None)
+            with connection.cursor() as cursor:
+                placeholders = ', '.join(['%s'] * len(chunk))
+                cursor.execute(f'DELETE FROM {alert_table} WHERE sensor_reading_id IN ({placeholders})', chunk)
+                cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', chunk)
+                deleted += cursor.rowcount
+    return deleted
+
+
+def recover():
+    """Finish archive parts left behind by an interrupted run"""
+    root = archive_root()
+    if not root.exists():
+        return 0
+    for tmp in root.glob('*/*/*.tmp'):
+        tmp.unlink()
+    finished = 0
+    for pending in sorted(root.glob('*/*/*.pending')):
+        with np.load(pending) as archive:
+            ids = archive['id'].tolist()
+        _delete_readings(ids)
+        os.replace(pending, pending.with_suffix('.npz'))
+        finished += 1
+    if finished:
+        caching.bump(caching.SENSORS, caching.ALERTS)
+    return finished
+
+
+def archivable(cutoff):
+    """Hot readings older than `cutoff` with no ACTIVE alert pointing at them"""
+    return SensorReading.objects.filter(timestamp__lt=cutoff).exclude(
+        id__in=Alert.objects.filter(status='ACTIVE').values('sensor_reading_id')
+    )
+
+
+def apply(days=None, now=None, dry_run=False):
+    """
+    Archive and delete every reading older than `days` (default
+    `RETENTION_DAYS`). Returns a summary of what was (or would be) moved.
+    """
+    days = int(getattr(settings, 'RETENTION_DAYS', 365)) if days is None else days
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=days)
+    fields = _fields()
+    names = [field.attname for field in fields]
+    alert_fields = _alert_fields()
+    alert_names = [field.attname for field in alert_fields]
+
+    summary = {'cutoff': cutoff, 'partitions': [], 'archived': 0, 'alerts_archived': 0, 'files': 0}
+    if not dry_run:
+        summary['recovered'] = recover()
+
+    partitions = archivable(cutoff).annotate(
+        partition_month=TruncMonth('timestamp', tzinfo=datetime.timezone.utc)
+    ).order_by().values_list('partition_month', 'slope_zone').distinct()
+
+    for month, zone in sorted(partitions):
+        month_end = (month + datetime.timedelta(days=32)).replace(day=1)
+        queryset = archivable(cutoff).filter(
+            timestamp__gte=month, timestamp__lt=month_end, slope_zone=zone
+        ).order_by('id')
+
+        if dry_run:
+            rows = queryset.count()
+            summary['partitions'].append({'month': month.strftime('%Y-%m'), 'zone': zone, 'rows': rows})
+            summary['archived'] += rows
+            summary['alerts_archived'] += Alert.objects.filter(sensor_reading__in=queryset).count()
+            continue
+
+        moved = 0
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).values_list(*names)[:part_rows()])
+            if not rows:
+                break
+            ids = [row[0] for row in rows]
+            alerts = list(Alert.objects.filter(
+                sensor_reading__in=queryset.filter(id__gte=ids[0], id__lte=ids[-1])
+            ).order_by('id').values_list(*alert_names))
+            columns = encode_columns(rows, fields)
+            columns.update({ALERT_PREFIX + name: values for name, values in encode_columns(alerts, alert_fields).items()})
+
+            path = _part_path(month, zone, ids[0], ids[-1])
+            _write_part(path, columns)
+            _delete_readings(ids)
+            os.replace(_pending(path), path)
+            caching.bump(caching.SENSORS, caching.ALERTS)
+            summary['alerts_archived'] += len(alerts)
+
+            moved += len(ids)
+            last_id = ids[-1]
+            summary['files'] += 1
+
+        summary['partitions'].append({'month': month.strftime('%Y-%m'), 'zone': zone, 'rows': moved})
+        summary['archived'] += moved
+
+    return summary
+
+
+def truncate():
+    """
+    Empty the hot tables in bounded chunks.
+
+    Uses plain `DELETE ... WHERE id IN (SELECT id ... LIMIT n)` statements
+    instead of `QuerySet.delete()`, which would load every row to collect
+    the cascade and hold one long write lock.
+    """
+    deleted = {}
+    size = chunk_size()
+    for model in (Alert, SensorLocation, SensorReading):
+        table = connection.ops.quote_name(model._meta.db_table)
+        total = 0
+        while True:
+            with db.serialized_write(), connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {table} WHERE id IN (SELECT id FROM {table} LIMIT %s)', [size]
+                )
+                if cursor.rowcount <= 0:
+                    break
+                total += cursor.rowcount
+        deleted[model._meta.model_name] = total
+    return deleted
+
+
+def purge_archive():
+    """Delete every archived part (and any leftovers of an interrupted run); returns the number of parts"""
+    root = archive_root()
+    if not root.exists():
+        return 0
+    parts = sum(1 for _ in root.glob('*/*/*.npz'))
+    shutil.rmtree(root)
+    return parts
+
+
+# ==================== READ PATH ====================
+
+def _months(start, end):
+    """Month directory names that can hold readings in [start, end)"""
+    root = archive_root()
+    if not root.exists():
+        return []
+    months = sorted(path.name for path in root.iterdir() if path.is_dir())
+    if start is not None:
+        months = [m for m in months if m >= start.strftime('%Y-%m')]
+    if end is not None:
+        months = [m for m in months if m <= end.strftime('%Y-%m')]
+    return months
+
+
+def iter_archive(start=None, end=None, zone=None, columns=None):
+    """
+    Yield one dict of column arrays per archive part, restricted to
+    readings with start <= timestamp < end (and `zone`, if given).
+
+    Only the month/zone directories that can match are opened, and only
+    the requested columns are decompressed.
+    """
+    wanted = list(columns) if columns is not None else [field.attname for field in _fields()]
+    load = list(dict.fromkeys(wanted + ['timestamp', 'slope_zone']))
+
+    for path in _parts(start, end, zone):
+        with np.load(path) as archive:
+            data = {name: archive[name] for name in load}
+        mask = _mask(data, start, end, zone)
+        if mask.any():
+            yield {name: data[name][mask] for name in wanted}
+
+
+def iter_archived_alerts(start=None, end=None, zone=None):
+    """
+    Yield one dict of alert column arrays per archive part, for the alerts
+    of the readings `iter_archive` returns for the same arguments.
+    """
+    names = [field.attname for field in _alert_fields()]
+    for path in _parts(start, end, zone):
+        with np.load(path) as archive:
+            if ALERT_PREFIX + 'id' not in archive.files:
+                continue
+            data = {name: archive[name] for name in ('id', 'timestamp', 'slope_zone')}
+            alerts = {name: archive[ALERT_PREFIX + name] for name in names}
+        ids = data['id'][_mask(data, start, end, zone)]
+        mask = np.isin(alerts['sensor_reading_id'], ids)
+        if mask.any():
+            yield {name: alerts[name][mask] for name in names}
+
+
+def _parts(start, end, zone):
+    """Published parts in the month/zone directories that can hold readings in [start, end)"""
+    root = archive_root()
+    zone_dir = (slugify(zone) or '_') if zone is not None else '*'
+    for month in _months(start, end):
+        yield from sorted((root / month).glob(f'{zone_dir}/*.npz'))
+
+
+def _mask(data, start, end, zone):
+    mask = np.ones(len(data['timestamp']), dtype=bool)
+    if start is not None:
+        mask &= data['timestamp'] >= to_micros(start)
+    if end is not None:
+        mask &= data['timestamp'] < to_micros(end)
+    if zone is not None:
+        mask &= data['slope_zone'] == zone
+    return mask
+
+
+class ArchivedKeys:
+    """
+    Membership test for (sensor_id, timestamp) against the archive. Each
+    month's keys are read from its parts once, on first use, so a caller
+    can check many chunks without decompressing the same parts again.
+    """
+
+    def __init__(self):
+        self._months = {}
+
+    def __contains__(self, key):
+        sensor_id, timestamp = key
+        month = timestamp.astimezone(datetime.timezone.utc).strftime('%Y-%m')
+        keys = self._months.get(month)
+        if keys is None:
+            keys = self._months[month] = self._load(month)
+        return (sensor_id, to_micros(timestamp)) in keys
+
+    @staticmethod
+    def _load(month):
+        keys = set()
+        for path in sorted((archive_root() / month).glob('*/*.npz')):
+            with np.load(path) as archive:
+                keys.update(zip(archive['sensor_id'].tolist(), archive['timestamp'].tolist()))
+        return keys
+
+
+def export_columns():
+    """Columns of the CSV upload format, in upload order"""
+    return [field for field in _fields() if field.attname not in ('id', 'created_at')]
+
+
+def _formatter(field, archived):
+    kind = column_kind(field)
+    if kind == 'datetime':
+        if archived:
+            return lambda v: from_micros(v).strftime('%Y-%m-%d %H:%M:%S')
+        return lambda v: timezone.localtime(v, datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    if kind == 'decimal':
+        if archived:
+            places = field.decimal_places
+            return lambda v: '' if np.isnan(v) else f'{v:.{places}f}'
+        return lambda v: '' if v is None else f'{v:f}'
+    if kind == 'bool':
+        return lambda v: int(bool(v))
+    return lambda v: v
+
+
+def iter_rows(start=None, end=None, zone=None):
+    """
+    Yield readings as CSV-ready lists in the upload format, archived
+    parts first (grouped by month and zone), then hot rows by timestamp.
+    """
+    fields = export_columns()
+    names = [field.attname for field in fields]
+
+    archived = [_formatter(field, True) for field in fields]
+    for part in iter_archive(start, end, zone, names):
+        columns = [part[name].tolist() for name in names]
+        for values in zip(*columns):
+            yield [fmt(v) for fmt, v in zip(archived, values)]
+
+    hot = [_formatter(field, False) for field in fields]
+    queryset = SensorReading.objects.order_by('timestamp', 'id')
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    if zone is not None:
+        queryset = queryset.filter(slope_zone=zone)
+    for values in queryset.values_list(*names).iterator(chunk_size=chunk_size()):
+        yield [fmt(v) for fmt, v in zip(hot, values)]
+
+
+# ==================== ROLLUP ====================
+
+def daily_rollup(start=None, end=None, zone=None):
+    """
+    Per-day, per-zone aggregates across the hot table and the archive.
+
+    Partial counts, sums and maxima from both sides are merged. Sums are
+    kept as integers in units of each column's last decimal place, so
+    archived ranges report exactly the numbers they did while hot.
+    """
+    risk_scale = 10 ** SensorReading._meta.get_field('rockfall_risk_score').decimal_places
+    displacement_scale = 10 ** SensorReading._meta.get_field('displacement_rate_mm_per_day').decimal_places
+    totals = {}
+
+    def merge(day, zone_name, count, risk_sum, risk_max, events, displacement_sum):
+        entry = totals.setdefault((day, zone_name), [0, 0, None, 0, 0])
+        entry[0] += count
+        entry[1] += risk_sum
+        entry[2] = risk_max if entry[2] is None else max(entry[2], risk_max)
+        entry[3] += events
+        entry[4] += displacement_sum
+
+    hot = SensorReading.objects.all()
+    if start is not None:
+        hot = hot.filter(timestamp__gte=start)
+    if end is not None:
+        hot = hot.filter(timestamp__lt=end)
+    if zone is not None:
+        hot = hot.filter(slope_zone=zone)
+    rows = hot.annotate(
+        day=TruncDate('timestamp', tzinfo=datetime.timezone.utc)
+    ).order_by().values('day', 'slope_zone').annotate(
+        readings=Count('id'),
+        risk_sum=Sum('rockfall_risk_score'),
+        risk_max=Max('rockfall_risk_score'),
+        events=Count('id', filter=Q(rockfall_occurred=True)),
+        displacement_sum=Sum('displacement_rate_mm_per_day'),
+    )
+    for row in rows:
+        merge(row['day'], row['slope_zone'], row['readings'],
+              int(row['risk_sum'] * risk_scale), int(row['risk_max'] * risk_scale),
+              row['events'], int(row['displacement_sum'] * displacement_scale))
+
+    columns = ['timestamp', 'slope_zone', 'rockfall_risk_score', 'rockfall_occurred', 'displacement_rate_mm_per_day']
+    for part in iter_archive(start, end, zone, columns):
+        days = part['timestamp'] // MICROSECONDS_PER_DAY
+        keys, inverse = np.unique(
+            np.rec.fromarrays([days, part['slope_zone']]), return_inverse=True
+        )
+        inverse = inverse.ravel()
+        risk = np.rint(part['rockfall_risk_score'] * risk_scale).astype(np.int64)
+        displacement = np.rint(part['displacement_rate_mm_per_day'] * displacement_scale).astype(np.int64)
+
+        counts = np.bincount(inverse, minlength=len(keys))
+        events = np.bincount(inverse, weights=part['rockfall_occurred'], minlength=len(keys))
+        risk_sum = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(risk_sum, inverse, risk)
+        risk_max = np.full(len(keys), np.iinfo(np.int64).min)
+        np.maximum.at(risk_max, inverse, risk)
+        displacement_sum = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(displacement_sum, inverse, displacement)
+
+        for i, (day, zone_name) in enumerate(keys.tolist()):
+            merge(EPOCH.date() + datetime.timedelta(days=int(day)), zone_name, int(counts[i]),
+                  int(risk_sum[i]), int(risk_max[i]), int(events[i]), int(displacement_sum[i]))
+
+    return [
+        {
+            'date': day.isoformat(),
+            'slope_zone': zone_name,
+            'readings': count,
+            'avg_risk': round(risk_sum / (count * risk_scale), 2),
+            'max_risk': risk_max / risk_scale,
+            'rockfall_events': events,
+            'avg_displacement_rate_mm_per_day': round(displacement_sum / (count * displacement_scale), 4),
+        }
+        for (day, zone_name), (count, risk_sum, risk_max, events, displacement_sum) in sorted(totals.items())
+    ]
@@ -1,5 +1,11 @@
-from rest_framework import serializers
-from .models import User, SensorReading, Alert
+from django.conf import settings
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .models import User, SensorReading, Alert, SensorLocation, UploadSession
+from .ingest import is_supported
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -21,3 +27,123 @@ class AlertSerializer(serializers.ModelSerializer):
     class Meta:
         model = Alert
         fields = '__all__'
+
+
+class SensorLocationSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SensorLocation
+        fields = ['sensor_id', 'reading', 'latitude', 'longitude', 'cell_row', 'cell_col',
+                  'slope_zone', 'rockfall_risk_score', 'timestamp']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunk_size = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'total_size', 'sha256', 'received_bytes', 'status', 'result',
+                  'chunk_size', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'received_bytes', 'status', 'result', 'created_at', 'updated_at']
+    
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_BYTES
+    
+    def validate_filename(self, value):
+        if not is_supported(value):
+            raise serializers.ValidationError('File must be .csv, .csv.gz or .zip')
+        return value
+    
+    def validate_sha256(self, value):
+        value = value.strip().lower()
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value)):
+            raise serializers.ValidationError('Expected a hex SHA-256 digest')
+        return value
+
+
+# ==================== ROW ENCODER ====================
+
+class RowEncoder:
+    """
+    Read-only encoder for `.values_list()` tuples.
+
+    Compiles a ModelSerializer's fields once into a single row-to-dict
+    function, so list endpoints can skip model instantiation and the
+    per-row field machinery while producing exactly what
+    `serializer.data` would. Fetch rows with `values_list(*encoder.columns)`:
+    Decimal columns are selected as floats, which skips the ORM's
+    per-value Decimal conversion.
+    """
+
+    # float64 holds every decimal of up to 15 significant digits exactly.
+    FLOAT_DIGITS = 15
+
+    def __init__(self, serializer_class):
+        fields = serializer_class().fields
+        self.names = tuple(fields.keys())
+        self.columns = tuple(
+            Cast(field.source, FloatField()) if self._is_float_decimal(field) else field.source
+            for field in fields.values()
+        )
+        self.encode = self._compile(fields)
+
+    @staticmethod
+    def _is_plain_decimal(field):
+        return (
+            isinstance(field, serializers.DecimalField)
+            and getattr(field, 'coerce_to_string', True)
+            and not field.localize
+            and not field.normalize_output
+            and field.decimal_places is not None
+        )
+
+    @classmethod
+    def _is_float_decimal(cls, field):
+        return cls._is_plain_decimal(field) and field.max_digits is not None and field.max_digits <= cls.FLOAT_DIGITS
+
+    @staticmethod
+    def _is_iso_datetime(field):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        return (
+            isinstance(field, serializers.DateTimeField)
+            and output_format is not None
+            and output_format.lower() == ISO_8601
+            and not hasattr(field, 'timezone')
+        )
+
+    def _compile(self, fields):
+        namespace = {}
+        items = []
+        for index, (name, field) in enumerate(fields.items()):
+            value = f'row[{index}]'
+            if isinstance(field, (serializers.BooleanField, serializers.IntegerField, serializers.CharField)):
+                # The ORM already returns bool/int/str for these columns,
+                # which DRF would pass through unchanged.
+                expression = value
+            elif self._is_float_decimal(field):
+                # The column was stored with decimal_places, so rounding the
+                # float back to them gives the digits DRF would print.
+                expression = f"format({value}, '.{field.decimal_places}f')"
+            elif self._is_plain_decimal(field):
+                # Decimals come back from the ORM quantized to the column's
+                # decimal_places, so DRF's quantize step is a no-op.
+                expression = f"format({value}, 'f')"
+            elif self._is_iso_datetime(field) and settings.USE_TZ:
+                # DRF's enforce_timezone + isoformat, with the current time
+                # zone looked up once per call to encode_many.
+                expression = f"{value}.astimezone(tz).isoformat().replace('+00:00', 'Z')"
+            elif self._is_iso_datetime(field):
+                expression = f'{value}.isoformat()'
+            else:
+                namespace[f'convert_{index}'] = field.to_representation
+                expression = f'convert_{index}({value})'
+            if expression != value:
+                expression = f'None if {value} is None else {expression}'
+            items.append(f'{name!r}: {expression}')
+
+        source = 'def encode(row, tz):\n    return {' + ', '.join(items) + '}\n'
+        exec(compile(source, f'<RowEncoder {self.__class__.__name__}>', 'exec'), namespace)
+        return namespace['encode']
+
+    def encode_many(self, rows):
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        return [self.encode(row, tz) for row in rows]
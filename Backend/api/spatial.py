@@ -0,0 +1,216 @@
+"""
+Grid index over sensor locations.
+
+Each sensor's latest reading is stored in `SensorLocation`, bucketed into
+square lat/lon cells of `SPATIAL_GRID_CELL_DEG` degrees. Bounding-box,
+nearest-sensor and per-cell queries only touch the (cell_row, cell_col)
+index, never the `SensorReading` table.
+"""
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min, OuterRef, Subquery
+from django.utils import timezone
+
+from .models import SensorLocation, SensorReading
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180
+
+
+def cell_size():
+    return float(getattr(settings, 'SPATIAL_GRID_CELL_DEG', 0.01))
+
+
+def cell_for(latitude, longitude):
+    """Return the (row, col) grid cell containing a point"""
+    size = cell_size()
+    return math.floor(float(latitude) / size), math.floor(float(longitude) / size)
+
+
+def cell_bounds(row, col):
+    size = cell_size()
+    return {
+        'min_lat': round(row * size, 7),
+        'min_lon': round(col * size, 7),
+        'max_lat': round((row + 1) * size, 7),
+        'max_lon': round((col + 1) * size, 7),
+    }
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in meters"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+# ==================== INGEST ====================
+
+def index_readings(readings):
+    """
+    Upsert the index from freshly ingested readings.
+
+    Only the newest reading per sensor is kept, and an existing entry is
+    only replaced by a reading that is at least as recent.
+    """
+    latest = {}
+    for reading in readings:
+        if timezone.is_naive(reading.timestamp):
+            reading.timestamp = timezone.make_aware(reading.timestamp)
+        current = latest.get(reading.sensor_id)
+        if current is None or reading.timestamp >= current.timestamp:
+            latest[reading.sensor_id] = reading
+    if not latest:
+        return 0
+
+    now = timezone.now()
+    existing = SensorLocation.objects.in_bulk(list(latest), field_name='sensor_id')
+    to_create, to_update = [], []
+    for sensor_id, reading in latest.items():
+        location = existing.get(sensor_id)
+        if location is not None and location.timestamp > reading.timestamp:
+            continue
+        if location is None:
+            location = SensorLocation(sensor_id=sensor_id)
+            to_create.append(location)
+        else:
+            to_update.append(location)
+        location.reading_id = reading.pk
+        location.latitude = reading.latitude
+        location.longitude = reading.longitude
+        location.cell_row, location.cell_col = cell_for(reading.latitude, reading.longitude)
+        location.slope_zone = reading.slope_zone
+        location.rockfall_risk_score = reading.rockfall_risk_score
+        location.timestamp = reading.timestamp
+        location.updated_at = now
+
+    SensorLocation.objects.bulk_create(to_create)
+    SensorLocation.objects.bulk_update(to_update, [
+        'reading', 'latitude', 'longitude', 'cell_row', 'cell_col',
+        'slope_zone', 'rockfall_risk_score', 'timestamp', 'updated_at',
+    ])
+    return len(to_create) + len(to_update)
+
+
+def reindex(sensor_ids):
+    """Recompute the entries of these sensors from their newest remaining reading"""
+    sensor_ids = set(sensor_ids)
+    with transaction.atomic():
+        newest = [
+            SensorReading.objects.filter(sensor_id=sensor_id).order_by('-timestamp', '-id').first()
+            for sensor_id in sensor_ids
+        ]
+        SensorLocation.objects.filter(sensor_id__in=sensor_ids).delete()
+        return index_readings([reading for reading in newest if reading is not None])
+
+
+# ==================== QUERIES ====================
+
+def _in_cells(min_row, max_row, min_col, max_col):
+    return SensorLocation.objects.filter(
+        cell_row__gte=min_row, cell_row__lte=max_row,
+        cell_col__gte=min_col, cell_col__lte=max_col,
+    )
+
+
+def within(min_lat, min_lon, max_lat, max_lon):
+    """Indexed sensors inside a bounding box"""
+    min_row, min_col = cell_for(min_lat, min_lon)
+    max_row, max_col = cell_for(max_lat, max_lon)
+    return _in_cells(min_row, max_row, min_col, max_col).filter(
+        latitude__gte=min_lat, latitude__lte=max_lat,
+        longitude__gte=min_lon, longitude__lte=max_lon,
+    ).order_by('sensor_id')
+
+
+def nearest(latitude, longitude, k=5):
+    """
+    The k sensors closest to a point, as (distance_m, location) pairs.
+
+    Searches square rings of cells around the point's cell, doubling the
+    radius until k candidates are found and no unseen cell can hold a
+    closer sensor.
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    row, col = cell_for(latitude, longitude)
+    size = cell_size()
+
+    bounds = _extent()
+    if bounds is None:
+        return []
+    max_radius = max(
+        abs(row - bounds['min_row']), abs(bounds['max_row'] - row),
+        abs(col - bounds['min_col']), abs(bounds['max_col'] - col),
+    )
+
+    radius = 1
+    while True:
+        candidates = [
+            (haversine_m(latitude, longitude, float(loc.latitude), float(loc.longitude)), loc)
+            for loc in _in_cells(row - radius, row + radius, col - radius, col + radius)
+        ]
+        candidates.sort(key=lambda pair: (pair[0], pair[1].sensor_id))
+        if radius >= max_radius:
+            return candidates[:k]
+
+        # Anything outside the searched square is at least `radius` cells
+        # away in latitude or longitude; longitude degrees shrink towards
+        # the poles, so measure at the square's most poleward edge.
+        edge_lat = min(abs(latitude) + radius * size, 89.9)
+        guaranteed_m = radius * size * METERS_PER_DEGREE * math.cos(math.radians(edge_lat))
+        if len(candidates) >= k and candidates[k - 1][0] <= guaranteed_m:
+            return candidates[:k]
+        radius *= 2
+
+
+def _extent():
+    bounds = SensorLocation.objects.aggregate(
+        min_row=Min('cell_row'), max_row=Max('cell_row'),
+        min_col=Min('cell_col'), max_col=Max('cell_col'),
+    )
+    if bounds['min_row'] is None:
+        return None
+    return bounds
+
+
+def cell_aggregates(min_lat=None, min_lon=None, max_lat=None, max_lon=None):
+    """Latest-risk aggregates per grid cell, optionally limited to a bounding box"""
+    queryset = SensorLocation.objects.all()
+    if None not in (min_lat, min_lon, max_lat, max_lon):
+        min_row, min_col = cell_for(min_lat, min_lon)
+        max_row, max_col = cell_for(max_lat, max_lon)
+        queryset = _in_cells(min_row, max_row, min_col, max_col)
+
+    cells = queryset.values('cell_row', 'cell_col').annotate(
+        sensor_count=Count('id'),
+        avg_risk=Avg('rockfall_risk_score'),
+        max_risk=Max('rockfall_risk_score'),
+        latest_timestamp=Max('timestamp'),
+    ).order_by('cell_row', 'cell_col')
+
+    return [
+        {
+            'cell': [cell['cell_row'], cell['cell_col']],
+            'bounds': cell_bounds(cell['cell_row'], cell['cell_col']),
+            'sensor_count': cell['sensor_count'],
+            'avg_risk': round(float(cell['avg_risk']), 2),
+            'max_risk': float(cell['max_risk']),
+            'latest_timestamp': cell['latest_timestamp'],
+        }
+        for cell in cells
+    ]
+
+
+def rebuild():
+    """Rebuild the whole index from the newest reading of every sensor"""
+    newest = SensorReading.objects.filter(sensor_id=OuterRef('sensor_id')).order_by('-timestamp', '-id')
+    latest_ids = SensorReading.objects.order_by().values('sensor_id').annotate(
+        latest_id=Subquery(newest.values('id')[:1])
+    ).values_list('latest_id', flat=True)
+
+    SensorLocation.objects.all().delete()
+    return index_readings(SensorReading.objects.filter(id__in=list(latest_ids)))
@@ -1,3 +1,839 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import importlib
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+import zipfile
+from pathlib import Path
 
-# Create your tests here.
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.db import connection, connections, router, transaction
+from django.db.models import Avg, Count
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import analytics, benchmarks, caching, db, ingest, loadgen, metrics, retention, spatial
+from .admin import EstimatedCountPaginator, IndexedDatesQuerySet
+from .renderers import FastJSONRenderer
+from .serializers import RowEncoder, SensorReadingSerializer
+from .authentication import RoleRefreshToken, user_cache
+from .models import Alert, DataVersion, SensorLocation, SensorReading, UploadSession, User
+
+
+class SampleDataMixin:
+    """Loads the 500-row sample once per class; each test gets an authenticated client."""
+
+    @classmethod
+    def setUpTestData(cls):
+        with open(benchmarks.SAMPLE_CSV, newline='') as handle:
+            ingest.ingest(handle)
+        cls.user = User.objects.create_user(username='ops', role='ADMIN')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class RowEncoderTests(SampleDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Nulls and characters the renderers escape differently by default.
+        SensorReading.objects.filter(pk=SensorReading.objects.order_by('pk')[0].pk).update(
+            temperature_f=None, pore_pressure_psi=None, rock_type='Granite \u2028 é "quoted"')
+
+    def test_output_is_byte_identical_to_serializer(self):
+        queryset = SensorReading.objects.order_by('-timestamp')
+        encoder = RowEncoder(SensorReadingSerializer)
+        fast = FastJSONRenderer().render(encoder.encode_many(queryset.values_list(*encoder.columns)))
+        stock = JSONRenderer().render(SensorReadingSerializer(queryset, many=True).data)
+        self.assertEqual(fast, stock)
+
+    def test_datetimes_follow_the_current_time_zone(self):
+        queryset = SensorReading.objects.order_by('-timestamp')[:10]
+        encoder = RowEncoder(SensorReadingSerializer)
+        with timezone.override('Asia/Kolkata'):
+            fast = encoder.encode_many(queryset.values_list(*encoder.columns))
+            self.assertEqual(fast, SensorReadingSerializer(queryset, many=True).data)
+        self.assertTrue(fast[0]['timestamp'].endswith('+05:30'))
+
+    @override_settings(SENSOR_LIST_MAX_PAGE_SIZE=300)
+    def test_page_size_is_bounded(self):
+        self.assertEqual(len(self.client.get('/api/sensors/', {'page_size': 250}).data['results']), 250)
+        self.assertEqual(len(self.client.get('/api/sensors/', {'page_size': 1000}).data['results']), 300)
+        self.assertEqual(len(self.client.get('/api/sensors/').data['results']), 100)
+
+    def test_listing_uses_fast_renderer_only(self):
+        response = self.client.get('/api/sensors/', {'page': 1})
+        self.assertIsInstance(response.accepted_renderer, FastJSONRenderer)
+        self.assertEqual(response.content, JSONRenderer().render({
+            'count': 500, 'next': response.data['next'], 'previous': None,
+            'results': SensorReadingSerializer(SensorReading.objects.order_by('-timestamp')[:100], many=True).data,
+        }))
+        self.assertNotIsInstance(self.client.get('/api/sensors/statistics/').accepted_renderer, FastJSONRenderer)
+
+
+class SpatialIndexTests(SampleDataMixin, TestCase):
+    def newest(self, sensor_id):
+        return SensorReading.objects.filter(sensor_id=sensor_id).order_by('-timestamp', '-id').first()
+
+    def test_migration_backfills_existing_readings(self):
+        from django.apps import apps
+        migration = importlib.import_module('api.migrations.0006_backfill_sensorlocation')
+        indexed = list(SensorLocation.objects.order_by('sensor_id').values_list('sensor_id', 'reading_id', 'cell_row', 'cell_col'))
+        SensorLocation.objects.all().delete()
+
+        migration.index_existing_readings(apps, None)
+        self.assertEqual(list(SensorLocation.objects.order_by('sensor_id').values_list(
+            'sensor_id', 'reading_id', 'cell_row', 'cell_col')), indexed)
+
+    def test_ingest_indexes_newest_reading_per_sensor(self):
+        sensors = set(SensorReading.objects.values_list('sensor_id', flat=True))
+        self.assertEqual(set(SensorLocation.objects.values_list('sensor_id', flat=True)), sensors)
+        for location in SensorLocation.objects.all():
+            newest = self.newest(location.sensor_id)
+            self.assertEqual((location.reading_id, location.latitude, location.longitude),
+                             (newest.pk, newest.latitude, newest.longitude))
+            self.assertEqual((location.cell_row, location.cell_col), spatial.cell_for(newest.latitude, newest.longitude))
+
+    def test_within_nearest_and_cells(self):
+        location = SensorLocation.objects.order_by('sensor_id').first()
+        lat, lon = float(location.latitude), float(location.longitude)
+        box = {'min_lat': lat - 0.001, 'min_lon': lon - 0.001, 'max_lat': lat + 0.001, 'max_lon': lon + 0.001}
+        found = self.client.get('/api/sensors/within/', box).data
+        self.assertIn(location.sensor_id, [row['sensor_id'] for row in found])
+        for row in found:
+            self.assertTrue(box['min_lat'] <= float(row['latitude']) <= box['max_lat'])
+
+        nearest = self.client.get('/api/sensors/nearest/', {'lat': lat, 'lon': lon, 'k': 3}).data
+        self.assertEqual(nearest[0]['sensor_id'], location.sensor_id)
+        self.assertEqual(nearest[0]['distance_m'], 0)
+        self.assertEqual([row['distance_m'] for row in nearest], sorted(row['distance_m'] for row in nearest))
+        # Brute force over every indexed sensor agrees.
+        expected = sorted(SensorLocation.objects.all(), key=lambda loc: spatial.haversine_m(
+            lat, lon, float(loc.latitude), float(loc.longitude)))[:3]
+        self.assertEqual([row['sensor_id'] for row in nearest], [loc.sensor_id for loc in expected])
+
+        cells = self.client.get('/api/sensors/cells/').data['cells']
+        self.assertEqual(sum(cell['sensor_count'] for cell in cells), SensorLocation.objects.count())
+
+    def test_invalid_coordinates_are_rejected(self):
+        for url, params in (
+            ('/api/sensors/within/', {'min_lat': 'nan', 'min_lon': 0, 'max_lat': 1, 'max_lon': 1}),
+            ('/api/sensors/within/', {'min_lat': 2, 'min_lon': 0, 'max_lat': 1, 'max_lon': 1}),
+            ('/api/sensors/within/', {'min_lat': -91, 'min_lon': 0, 'max_lat': 1, 'max_lon': 1}),
+            ('/api/sensors/nearest/', {'lat': 'inf', 'lon': 0}),
+            ('/api/sensors/nearest/', {'lat': 0, 'lon': 181}),
+            ('/api/sensors/cells/', {'min_lat': 0, 'min_lon': '-inf', 'max_lat': 1, 'max_lon': 1}),
+        ):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 400, (url, params))
+            self.assertIn('error', response.data)
+
+    def test_deleting_newest_reading_reindexes_sensor(self):
+        location = SensorLocation.objects.order_by('sensor_id').first()
+        deleted = self.newest(location.sensor_id)
+        self.assertEqual(self.client.delete(f'/api/sensors/{deleted.pk}/').status_code, 204)
+
+        location = SensorLocation.objects.get(sensor_id=location.sensor_id)
+        replacement = self.newest(location.sensor_id)
+        self.assertEqual((location.reading_id, location.timestamp, location.rockfall_risk_score),
+                         (replacement.pk, replacement.timestamp, replacement.rockfall_risk_score))
+
+        for reading in SensorReading.objects.filter(sensor_id=location.sensor_id):
+            self.client.delete(f'/api/sensors/{reading.pk}/')
+        self.assertFalse(SensorLocation.objects.filter(sensor_id=location.sensor_id).exists())
+
+
+class SyntheticDatasetTests(SimpleTestCase):
+    def test_schema_matches_training_csv(self):
+        with open(benchmarks.SAMPLE_CSV, newline='') as handle:
+            header = next(csv.reader(handle))
+        frame = benchmarks.generate_readings(250)
+        self.assertEqual(list(frame.columns), header)
+        self.assertEqual(len(frame), 250)
+        self.assertFalse(frame.isna().any().any())
+
+    def test_generator_is_reproducible(self):
+        first = benchmarks.generate_csv(100, seed=7)
+        self.assertEqual(first, benchmarks.generate_csv(100, seed=7))
+        self.assertNotEqual(first, benchmarks.generate_csv(100, seed=8))
+
+    def test_parse_size(self):
+        self.assertEqual(benchmarks.parse_size('10k'), 10000)
+        self.assertEqual(benchmarks.parse_size('1M'), 1000000)
+        self.assertEqual(benchmarks.parse_size('2.5k'), 2500)
+        self.assertEqual(benchmarks.parse_size('1234'), 1234)
+
+
+class ConditionalGetTests(SampleDataMixin, TestCase):
+    def stats(self, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/alerts/dashboard_stats/', **headers)
+        alert_queries = [q for q in queries.captured_queries if '"api_alert"' in q['sql']]
+        return response, alert_queries
+
+    def test_matching_etag_returns_304_without_running_queries(self):
+        response, queries = self.stats()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(queries)
+
+        revalidated, queries = self.stats(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+        self.assertEqual(queries, [])
+
+    def test_repeat_request_is_served_from_cache(self):
+        first, _ = self.stats()
+        second, queries = self.stats()
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(queries, [])
+
+    def assertInvalidated(self, before, **expected):
+        response, queries = self.stats(HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], before['ETag'])
+        self.assertTrue(queries)
+        for name, value in expected.items():
+            self.assertEqual(response.data[name], value)
+
+    def test_ingest_invalidates(self):
+        before, _ = self.stats()
+        rows = benchmarks.SAMPLE_CSV.read_text().splitlines()
+        shifted = [rows[0]] + [line.replace('2024-', '2028-', 1) for line in rows[1:]]
+        ingest.ingest(io.StringIO('\n'.join(shifted)))
+        self.assertInvalidated(before, total_alerts=2 * before.data['total_alerts'])
+
+    def test_alert_saved_through_orm_invalidates(self):
+        before, _ = self.stats()
+        alert = Alert.objects.filter(status='ACTIVE').first()
+        alert.status = 'RESOLVED'
+        with self.captureOnCommitCallbacks(execute=True):
+            alert.save()
+        self.assertInvalidated(before, active_alerts=before.data['active_alerts'] - 1)
+
+    def test_clear_all_invalidates(self):
+        # clear_all purges ARCHIVE_ROOT; the test runner keeps it in a temporary directory.
+        self.assertTrue(retention.archive_root().is_relative_to(tempfile.gettempdir()))
+        before, _ = self.stats()
+        self.assertEqual(self.client.delete('/api/sensors/clear_all/').status_code, 200)
+        self.assertInvalidated(before, total_alerts=0)
+
+
+class RegressionCheckTests(SimpleTestCase):
+    baseline = {'metrics': {'ingest_rows_per_s': 1000.0, 'statistics_ms': 10.0}}
+
+    def test_within_threshold_passes(self):
+        result = {'metrics': {'ingest_rows_per_s': 800.0, 'statistics_ms': 12.0}}
+        self.assertEqual(benchmarks.compare(result, self.baseline, threshold=0.25), [])
+
+    def test_regressions_are_reported_in_the_right_direction(self):
+        result = {'metrics': {'ingest_rows_per_s': 700.0, 'statistics_ms': 13.0}}
+        regressions = benchmarks.compare(result, self.baseline, threshold=0.25)
+        self.assertEqual(len(regressions), 2)
+        self.assertTrue(regressions[0].startswith('ingest_rows_per_s'))
+
+    def test_changes_below_the_noise_floor_pass(self):
+        baseline = {'metrics': {'statistics_ms': 2.4}}
+        self.assertEqual(benchmarks.compare({'metrics': {'statistics_ms': 3.1}}, baseline), [])
+        self.assertEqual(len(benchmarks.compare({'metrics': {'statistics_ms': 4.5}}, baseline)), 1)
+
+    def test_improvements_never_fail(self):
+        result = {'metrics': {'ingest_rows_per_s': 5000.0, 'statistics_ms': 1.0}}
+        self.assertEqual(benchmarks.compare(result, self.baseline), [])
+
+
+@override_settings(RETENTION_CHUNK_SIZE=50)
+class RetentionTests(TestCase):
+    # The sample covers 2024-01-01 .. 2024-04-05; a 30 day window on March 1
+    # archives January.
+    now = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        override = override_settings(ARCHIVE_ROOT=Path(workdir.name))
+        override.enable()
+        self.addCleanup(override.disable)
+        with open(benchmarks.SAMPLE_CSV, newline='') as handle:
+            ingest.ingest(handle)
+        self.export = sorted(map(tuple, retention.iter_rows()))
+        self.rollup = retention.daily_rollup()
+
+    def parts(self, suffix):
+        return sorted(retention.archive_root().glob(f'*/*/*.{suffix}'))
+
+    def test_archive_round_trip(self):
+        cutoff = self.now - timedelta(days=30)
+        expected = retention.archivable(cutoff).count()
+        summary = retention.apply(days=30, now=self.now)
+
+        self.assertEqual(summary['archived'], expected)
+        self.assertGreater(expected, 0)
+        self.assertEqual(SensorReading.objects.count(), 500 - expected)
+        self.assertFalse(retention.archivable(cutoff).exists())
+        self.assertTrue(self.parts('npz'))
+        self.assertFalse(self.parts('pending'))
+        # Readings with active alerts stay hot.
+        self.assertTrue(Alert.objects.filter(sensor_reading__timestamp__lt=cutoff).exists())
+
+        # Export and rollup report exactly what they did while everything was hot.
+        self.assertEqual(sorted(map(tuple, retention.iter_rows())), self.export)
+        self.assertEqual(retention.daily_rollup(), self.rollup)
+        response = self.client_for_admin().get('/api/sensors/export/', {'end': '2024-01-15'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines) - 1, sum(1 for row in self.export if row[0] < '2024-01-15'))
+
+    def test_resolved_alerts_are_archived_with_their_readings(self):
+        cutoff = self.now - timedelta(days=30)
+        old = Alert.objects.filter(sensor_reading__timestamp__lt=cutoff).order_by('id')
+        resolved = list(old.values_list('alert_id', flat=True)[::2])
+        Alert.objects.filter(alert_id__in=resolved).update(status='RESOLVED')
+        active = old.filter(status='ACTIVE').count()
+        hot_before = SensorReading.objects.filter(timestamp__lt=cutoff).count()
+
+        summary = retention.apply(days=30, now=self.now)
+        self.assertEqual(summary['alerts_archived'], len(resolved))
+        self.assertEqual(summary['archived'], hot_before - active)
+        self.assertEqual(SensorReading.objects.filter(timestamp__lt=cutoff).count(), active)
+        self.assertFalse(Alert.objects.filter(alert_id__in=resolved).exists())
+
+        archived = [alert for part in retention.iter_archived_alerts() for alert in part['alert_id'].tolist()]
+        self.assertEqual(sorted(archived), sorted(resolved))
+        self.assertEqual(sorted(map(tuple, retention.iter_rows())), self.export)
+
+    def test_recover_finishes_interrupted_part(self):
+        with mock.patch.object(retention, '_delete_readings', side_effect=RuntimeError('crash')):
+            with self.assertRaises(RuntimeError):
+                retention.apply(days=30, now=self.now)
+        pending = self.parts('pending')
+        self.assertEqual(len(pending), 1)
+        self.assertEqual(SensorReading.objects.count(), 500)
+        # The pending part is not visible yet, so nothing is counted twice.
+        self.assertEqual(sorted(map(tuple, retention.iter_rows())), self.export)
+
+        self.assertEqual(retention.recover(), 1)
+        self.assertFalse(self.parts('pending'))
+        self.assertEqual(sorted(map(tuple, retention.iter_rows())), self.export)
+
+        retention.apply(days=30, now=self.now)
+        self.assertEqual(sorted(map(tuple, retention.iter_rows())), self.export)
+        self.assertEqual(retention.daily_rollup(), self.rollup)
+
+    def test_clear_all_purges_archive(self):
+        retention.apply(days=30, now=self.now)
+        response = self.client_for_admin().delete('/api/sensors/clear_all/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(response.data['archive_parts_deleted'], 0)
+        self.assertEqual(list(retention.iter_rows()), [])
+        self.assertEqual(retention.daily_rollup(), [])
+
+    def client_for_admin(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='ops', role='ADMIN'))
+        return client
+
+
+class BenchmarkRunTests(TestCase):
+    rows = 500
+
+    def test_run_reports_query_metrics(self):
+        result = benchmarks.run(self.rows, repeat=1, predictions=0)
+        self.assertEqual(result['rows'], self.rows)
+        for name in ('ingest_rows_per_s', 'list_first_page_ms', 'list_last_page_ms',
+                     'statistics_ms', 'dashboard_stats_ms'):
+            self.assertGreater(result['metrics'][name], 0, name)
+
+    @unittest.skipUnless(os.environ.get('BENCHMARK_MEMORY'), 'set BENCHMARK_MEMORY=1 to allocate 200 MB')
+    def test_peak_memory_is_measured_per_run(self):
+        start = benchmarks._reset_peak_memory()
+        if start is None:
+            self.skipTest('peak RSS cannot be reset on this platform')
+        block = b'x' * (200 * 1024 * 1024)
+        del block
+        self.assertGreaterEqual(benchmarks._peak_memory_mb(start), 150)
+        # An earlier peak in the same process does not leak into the next run.
+        self.assertLess(benchmarks._peak_memory_mb(benchmarks._reset_peak_memory()), 150)
+
+    @unittest.skipUnless(os.environ.get('BENCHMARK_PREDICT'), 'set BENCHMARK_PREDICT=1 to load the models')
+    def test_run_reports_prediction_metrics(self):
+        result = benchmarks.run(self.rows, repeat=1, predictions=1, sequential=2)
+        self.assertGreater(result['metrics']['predict_single_ms'], 0)
+        self.assertGreater(result['metrics']['predict_sequential_ms'], 0)
+
+    def test_no_regression_against_saved_baseline(self):
+        # benchmarks/baseline-500.json; refresh it with
+        # `manage.py benchmark --sizes 500 --predictions 0 --readers 0 --save-baseline`
+        baseline = benchmarks.load_baseline(str(self.rows))
+        self.assertIsNotNone(baseline)
+        threshold = float(os.environ.get('BENCHMARK_THRESHOLD', benchmarks.DEFAULT_THRESHOLD))
+        result = benchmarks.run(baseline['rows'], seed=baseline['seed'], repeat=baseline['repeat'], predictions=0)
+        self.assertEqual(benchmarks.compare(result, baseline, threshold), [])
+
+
+class ReplayScheduleTests(SimpleTestCase):
+    def test_rows_are_grouped_into_ticks_in_time_order(self):
+        rows = [
+            {'timestamp': '2024-01-01 01:00:00', 'sensor_id': 'B'},
+            {'timestamp': '2024-01-01 00:00:00', 'sensor_id': 'A'},
+            {'timestamp': '2024-01-01 01:00:00', 'sensor_id': 'C'},
+        ]
+        ticks = loadgen.ticks_from_rows(rows)
+        self.assertEqual([offset for offset, _ in ticks], [0.0, 3600.0])
+        self.assertEqual([row['sensor_id'] for row in ticks[1][1]], ['B', 'C'])
+
+    def test_burst_copies_are_distinct_readings(self):
+        rows = [{'timestamp': '2024-01-01 06:00:00', 'sensor_id': 'A'}, {'timestamp': '2024-01-01 06:00:00', 'sensor_id': 'B'}]
+        copies = [rows] + [loadgen.burst_rows(rows, copy) for copy in range(1, 5)]
+        keys = {(row['sensor_id'], row['timestamp']) for copy in copies for row in copy}
+        self.assertEqual(len(keys), 10)
+        self.assertEqual(copies[2][0], {'timestamp': '2024-01-01 06:00:02', 'sensor_id': 'A'})
+
+    def test_endpoint_summary(self):
+        stats = loadgen.EndpointStats()
+        for ms in range(1, 101):
+            stats.record(ms / 1000, 200 if ms <= 98 else 500)
+        summary = stats.summary(elapsed=10)
+        self.assertEqual(summary['requests'], 100)
+        self.assertEqual(summary['throughput_rps'], 10.0)
+        self.assertEqual(summary['error_rate'], 0.02)
+        self.assertEqual((summary['p50_ms'], summary['p99_ms']), (50.0, 99.0))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+
+    def test_exposition_format(self):
+        registry = metrics.Registry()
+        registry.describe('jobs_total', 'Jobs run.')
+        registry.inc('jobs_total', queue='a"b\\c')
+        registry.inc('jobs_total', 2, queue='a"b\\c')
+        registry.observe('job_seconds', 0.5, buckets=(0.1, 1), queue='x')
+        registry.observe('job_seconds', 3, buckets=(0.1, 1), queue='x')
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP jobs_total Jobs run.',
+            '# TYPE jobs_total counter',
+            'jobs_total{queue="a\\"b\\\\c"} 3',
+            '# TYPE job_seconds histogram',
+            'job_seconds_bucket{queue="x",le="0.1"} 0',
+            'job_seconds_bucket{queue="x",le="1"} 1',
+            'job_seconds_bucket{queue="x",le="+Inf"} 2',
+            'job_seconds_sum{queue="x"} 3.5',
+            'job_seconds_count{queue="x"} 2',
+        ]) + '\n')
+
+    def test_requests_are_recorded(self):
+        self.client.get('/api/sensors/statistics/')
+        self.client.force_login(User.objects.create_user(username='ops', role='ADMIN'))
+        body = self.client.get('/api/metrics/').content.decode()
+        self.assertIn('http_requests_total{endpoint="sensor-statistics",method="GET",status="200"} 1', body)
+        self.assertIn('db_queries_per_request_count{endpoint="sensor-statistics"} 1', body)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+    def test_admin_is_required_without_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        manager = RoleRefreshToken.for_user(User.objects.create_user(username='manager', role='MANAGER')).access_token
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION=f'Bearer {manager}').status_code, 403)
+        admin = RoleRefreshToken.for_user(User.objects.create_user(username='ops', role='ADMIN')).access_token
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION=f'Bearer {admin}').status_code, 200)
+
+    def test_profile_header_is_admin_only(self):
+        def profile(user):
+            token = RoleRefreshToken.for_user(user).access_token
+            response = self.client.get('/api/alerts/dashboard_stats/', HTTP_X_PROFILE='1',
+                                       HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        self.assertNotIn('profile', profile(User.objects.create_user(username='manager', role='MANAGER')))
+        self.assertNotIn('profile', self.client.get('/api/alerts/dashboard_stats/', HTTP_X_PROFILE='1').json())
+        report = profile(User.objects.create_user(username='ops', role='ADMIN'))
+        self.assertIn('profile', report)
+        self.assertGreater(report['db_queries'], 0)
+
+
+class TokenAuthenticationTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username='ops', email='ops@example.com', password='pass-1234', role='ADMIN')
+        self.client = APIClient()
+        response = self.client.post('/api/auth/login/', {'email': 'ops@example.com', 'password': 'pass-1234', 'role': 'ADMIN'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['tokens']['access']}")
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 200)
+        return [query for query in queries if 'api_user' in query['sql']]
+
+    def test_login_rejects_bad_credentials(self):
+        failures = []
+        user_login_failed.connect(lambda sender, credentials, **kwargs: failures.append(credentials['email']),
+                                  weak=False, dispatch_uid='test-login-failed')
+        self.addCleanup(user_login_failed.disconnect, dispatch_uid='test-login-failed')
+        for email, password in (('ops@example.com', 'wrong'), ('nobody@example.com', 'pass-1234')):
+            response = APIClient().post('/api/auth/login/', {'email': email, 'password': password, 'role': 'ADMIN'}, format='json')
+            self.assertEqual(response.status_code, 401)
+        self.assertEqual(failures, ['ops@example.com', 'nobody@example.com'])
+
+    def test_login_looks_the_user_up_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = APIClient().post('/api/auth/login/', {'email': 'ops@example.com', 'password': 'pass-1234', 'role': 'ADMIN'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT') and 'api_user' in query['sql']]), 1)
+
+    def test_cached_user_needs_no_query(self):
+        self.assertEqual(len(self.user_queries()), 1)
+        self.assertEqual(self.user_queries(), [])
+
+    def test_user_change_invalidates_cache(self):
+        self.user_queries()
+        self.user.role = 'MANAGER'
+        self.user.save()
+        response = self.client.get('/api/auth/profile/')
+        self.assertEqual(response.status_code, 401)
+
+
+class DatabaseRoutingTests(TestCase):
+    def test_writes_and_transactional_reads_use_default(self):
+        # TestCase wraps every test in a transaction on `default`.
+        self.assertEqual(router.db_for_write(SensorReading), 'default')
+        self.assertEqual(router.db_for_read(SensorReading), 'default')
+
+    def test_connection_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+
+
+class ReadAliasMetricsTests(TransactionTestCase):
+    databases = {'default', 'read'}
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.clear()
+        self.addCleanup(metrics.registry.clear)
+
+    def test_queries_on_read_alias_are_recorded(self):
+        # Outside a transaction, reads are routed to the `read` alias.
+        self.assertEqual(router.db_for_read(SensorReading), 'read')
+        self.client.get('/api/sensors/statistics/')
+        self.client.force_login(User.objects.create_user(username='ops', role='ADMIN'))
+        body = self.client.get('/api/metrics/').content.decode()
+        line = next(line for line in body.splitlines()
+                    if line.startswith('db_queries_per_request_sum{endpoint="sensor-statistics"}'))
+        # Data version lookup plus the four counts.
+        self.assertGreaterEqual(float(line.split()[-1]), 5)
+
+
+class WriteTransactionTests(TransactionTestCase):
+    databases = {'default', 'read'}
+
+    def test_writes_take_the_lock_when_they_begin(self):
+        with CaptureQueriesContext(connection) as queries, db.serialized_write():
+            DataVersion.objects.count()
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+        read = connections['read']
+        with CaptureQueriesContext(read) as queries, transaction.atomic(using='read'):
+            DataVersion.objects.using('read').count()
+        self.assertEqual(queries[0]['sql'], 'BEGIN')
+
+    def test_bump_goes_through_the_write_lock(self):
+        with CaptureQueriesContext(connection) as queries:
+            caching.bump(caching.SENSORS)
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+        caching.bump(caching.SENSORS)
+        self.assertEqual(DataVersion.objects.get(scope=caching.SENSORS).version, 2)
+
+
+class IdempotentUploadTests(TestCase):
+    def setUp(self):
+        self.csv = benchmarks.SAMPLE_CSV.read_bytes()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='ops', role='ADMIN'))
+        workdir = tempfile.TemporaryDirectory()
+        self.addCleanup(workdir.cleanup)
+        override = override_settings(UPLOAD_ROOT=Path(workdir.name) / 'uploads', ARCHIVE_ROOT=Path(workdir.name) / 'archive')
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, name, data):
+        response = self.client.post('/api/sensors/upload_csv/', {'file': SimpleUploadedFile(name, data)}, format='multipart')
+        return response.status_code, response.data
+
+    def test_reupload_in_any_format_creates_nothing(self):
+        self.assertEqual(self.upload('feed.csv', self.csv)[1]['created'], 500)
+        alerts = Alert.objects.count()
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as handle:
+            handle.writestr('export/feed.csv', self.csv)
+        for name, data in (('feed.csv.gz', gzip.compress(self.csv)), ('feed.zip', archive.getvalue())):
+            code, result = self.upload(name, data)
+            self.assertEqual((code, result['created'], result['duplicates']), (201, 0, 500), name)
+        self.assertEqual(SensorReading.objects.count(), 500)
+        self.assertEqual(Alert.objects.count(), alerts)
+
+    def test_out_of_range_row_is_reported_and_the_rest_stored(self):
+        lines = self.csv.decode().splitlines()
+        fields = lines[3].split(',')
+        fields[lines[0].split(',').index('latitude')] = '123456.5'
+        lines[3] = ','.join(fields)
+
+        code, result = self.upload('feed.csv', '\n'.join(lines).encode())
+        self.assertEqual((code, result['created'], result['errors']), (201, 499, 1))
+        self.assertIn('Row 4', result['error_samples'][0])
+        self.assertIn('latitude', result['error_samples'][0])
+
+    def test_reupload_after_archiving_creates_nothing(self):
+        self.upload('feed.csv', self.csv)
+        archived = retention.apply(days=30, now=datetime(2024, 3, 1, tzinfo=dt_timezone.utc))['archived']
+        self.assertGreater(archived, 0)
+
+        parts = len(list(retention.archive_root().glob('*/*/*.npz')))
+        with mock.patch.object(ingest, 'INGEST_CHUNK_ROWS', 50), \
+                mock.patch.object(retention.np, 'load', wraps=retention.np.load) as load:
+            code, result = self.upload('feed.csv', self.csv)
+        self.assertEqual((code, result['created'], result['duplicates']), (201, 0, 500))
+        self.assertEqual(SensorReading.objects.count(), 500 - archived)
+        self.assertEqual(sum(1 for _ in retention.iter_rows()), 500)
+        # Every part is read once per upload, not once per chunk.
+        self.assertEqual(load.call_count, parts)
+
+    def test_only_csv_archives_are_accepted(self):
+        self.assertEqual(self.upload('dump.sql.gz', gzip.compress(self.csv))[0], 400)
+        self.assertEqual(self.upload('feed.gz', gzip.compress(self.csv))[0], 400)
+
+    def test_concurrent_chunks_at_one_offset_store_one(self):
+        data = gzip.compress(self.csv)
+        session_id = self.client.post('/api/uploads/', {'filename': 'feed.csv.gz', 'total_size': len(data)}, format='json').data['id']
+        stale = UploadSession.objects.get(pk=session_id)
+        first, second = data[:5000], data[5000:10000]
+        self.client.put(f'/api/uploads/{session_id}/chunk/', first, content_type='application/octet-stream',
+                        HTTP_X_UPLOAD_OFFSET='0', HTTP_X_CHUNK_SHA256=hashlib.sha256(first).hexdigest())
+
+        # A request that loaded the session before the first one stored.
+        with self.assertRaises(ingest.OffsetMismatch):
+            ingest.append_chunk(stale, 0, len(second), hashlib.sha256(second).hexdigest(), io.BytesIO(second))
+        self.assertEqual(ingest.part_path(stale).read_bytes(), first)
+        self.assertEqual(stale.received_bytes, 5000)
+
+    def test_damaged_archive_is_rejected(self):
+        self.assertEqual(self.upload('feed.csv.gz', b'not gzip')[0], 400)
+
+    def test_chunked_upload_resumes_and_verifies_checksums(self):
+        data = gzip.compress(self.csv)
+        session = self.client.post('/api/uploads/', {
+            'filename': 'feed.csv.gz', 'total_size': len(data), 'sha256': hashlib.sha256(data).hexdigest(),
+        }, format='json').data
+        url = f"/api/uploads/{session['id']}/"
+
+        def put(offset, chunk, checksum=None):
+            return self.client.put(url + 'chunk/', chunk, content_type='application/octet-stream',
+                                   HTTP_X_UPLOAD_OFFSET=str(offset),
+                                   HTTP_X_CHUNK_SHA256=checksum or hashlib.sha256(chunk).hexdigest())
+
+        size = 5000
+        self.assertEqual(put(0, data[:size]).data['offset'], size)
+        self.assertEqual(put(0, data[:size]).data['offset'], size)  # retried chunk
+        self.assertEqual(put(size, data[size:2 * size], '0' * 64).status_code, 400)
+        skipped = put(2 * size, data[2 * size:3 * size])
+        self.assertEqual((skipped.status_code, skipped.data['offset']), (409, size))
+
+        offset = self.client.get(url).data['received_bytes']
+        while offset < len(data):
+            offset = put(offset, data[offset:offset + size]).data['offset']
+        result = self.client.post(url + 'complete/').data
+        self.assertEqual((result['created'], result['errors']), (500, 0))
+        self.assertEqual(self.client.post(url + 'complete/').data['created'], 500)
+
+
+class LargeTableAdminTests(SampleDataMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.root = User.objects.create_superuser(username='root', email='root@example.com', password='pw')
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_class()
+        self.client.force_login(self.root)
+
+    def test_date_hierarchy_matches_django(self):
+        readings = SensorReading.objects.all()
+        indexed = IndexedDatesQuerySet(model=SensorReading).filter(timestamp__year=2024)
+        for kind in ('year', 'month', 'day'):
+            self.assertEqual(list(indexed.datetimes('timestamp', kind)),
+                             list(readings.filter(timestamp__year=2024).datetimes('timestamp', kind)), kind)
+        self.assertEqual(list(indexed.datetimes('timestamp', 'month', order='DESC')),
+                         list(readings.datetimes('timestamp', 'month', order='DESC')))
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=100)
+    def test_counts_are_estimated_or_capped(self):
+        self.assertEqual(EstimatedCountPaginator(SensorReading.objects.order_by('pk'), 100).count, 500)
+        self.assertEqual(EstimatedCountPaginator(SensorReading.objects.filter(sensor_status='ACTIVE'), 100).count, 100)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=100)
+    def test_estimate_ignores_primary_key_gaps(self):
+        # Retention deletes leave gaps in the id range.
+        ids = list(SensorReading.objects.order_by('id').values_list('id', flat=True))
+        SensorReading.objects.filter(id__in=ids[1:-1:2]).delete()
+        cache.clear()
+        count = SensorReading.objects.count()
+        self.assertLess(count, ids[-1] - ids[0] + 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(EstimatedCountPaginator(SensorReading.objects.order_by('pk'), 100).count, count)
+        with self.assertNumQueries(0):
+            self.assertEqual(EstimatedCountPaginator(SensorReading.objects.order_by('pk'), 100).count, count)
+
+    def test_prefix_search_ignores_case(self):
+        expected = SensorReading.objects.filter(sensor_id__startswith='SENSOR-00').count()
+        response = self.client.get('/admin/api/sensorreading/', {'q': 'sensor-00'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, expected)
+
+        for params in ({'timestamp__year': '2024', 'timestamp__month': '2'}, {'slope_zone': 'Zone A'}):
+            self.assertEqual(self.client.get('/admin/api/sensorreading/', params).status_code, 200)
+
+    def test_alerts_sort_by_created_at_and_search_by_zone(self):
+        response = self.client.get('/admin/api/alert/', {'q': '"zone a"'})
+        self.assertEqual(response.context['cl'].result_count, Alert.objects.filter(zone_name='Zone A').count())
+        self.assertGreater(response.context['cl'].result_count, 0)
+
+        newest_first = [alert.created_at for alert in self.client.get('/admin/api/alert/').context['cl'].result_list]
+        self.assertEqual(newest_first, sorted(newest_first, reverse=True))
+        oldest_first = self.client.get('/admin/api/alert/', {'o': '6'}).context['cl'].result_list
+        self.assertEqual([alert.created_at for alert in oldest_first], sorted(newest_first)[:len(oldest_first)])
+
+    def test_alert_form_does_not_list_readings(self):
+        response = self.client.get('/admin/api/alert/add/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'SensorReading object')
+
+
+class AnalyticsTests(SampleDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        analytics.snapshots.clear()
+        self.addCleanup(analytics.snapshots.clear)
+
+    def query(self, spec):
+        return self.client.post('/api/analytics/', spec, format='json')
+
+    def test_concurrent_cold_requests_build_once(self):
+        store = analytics.SnapshotStore()
+        built = []
+
+        def slow_build():
+            time.sleep(0.05)
+            built.append(object())
+            return built[-1]
+
+        with mock.patch.object(analytics, 'build', side_effect=slow_build):
+            threads = [threading.Thread(target=store.get) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(len(built), 1)
+            self.assertIs(store.get(), built[0])
+            store.refresh()
+        self.assertEqual(len(built), 2)
+
+    def test_options_does_not_build(self):
+        with mock.patch.object(analytics, 'build') as build, self.assertNumQueries(0):
+            self.assertEqual(self.client.options('/api/analytics/').status_code, 200)
+        build.assert_not_called()
+
+    def test_group_by_matches_orm(self):
+        response = self.query({
+            'where': [['precipitation_in', 'gt', 0], ['timestamp', 'gte', '2024-02-01']],
+            'group_by': ['rock_type', 'slope_zone'],
+            'select': {'pore_pressure': 'mean(pore_pressure_psi)', 'readings': 'count()'},
+        })
+        self.assertEqual(response.status_code, 200)
+        expected = SensorReading.objects.filter(precipitation_in__gt=0, timestamp__gte='2024-02-01T00:00:00Z').values(
+            'rock_type', 'slope_zone').annotate(pore_pressure=Avg('pore_pressure_psi'), readings=Count('id')).order_by('rock_type', 'slope_zone')
+        self.assertEqual(len(response.data['results']), len(expected))
+        for row, orm in zip(response.data['results'], expected):
+            self.assertEqual((row['rock_type'], row['slope_zone'], row['readings']),
+                             (orm['rock_type'], orm['slope_zone'], orm['readings']))
+            self.assertAlmostEqual(row['pore_pressure'], float(orm['pore_pressure']), places=6)
+
+    def test_buckets_rates_and_ordering(self):
+        results = self.query({
+            'group_by': ['timestamp:month', 'blast_frequency_7days:5'],
+            'select': {'rockfall_rate': 'mean(rockfall_occurred)', 'first': 'min(timestamp)'},
+            'order_by': ['-rockfall_rate'],
+            'limit': 3,
+        }).data
+        self.assertTrue(results['truncated'])
+        self.assertEqual(len(results['results']), 3)
+        rates = [row['rockfall_rate'] for row in results['results']]
+        self.assertEqual(rates, sorted(rates, reverse=True))
+        first = results['results'][0]
+        self.assertTrue(first['first'].startswith(first['timestamp:month'][:7]))
+        self.assertEqual(first['blast_frequency_7days:5'] % 5, 0)
+
+    def test_results_are_cached_until_the_snapshot_changes(self):
+        spec = {'where': [['slope_zone', 'eq', 'Zone A']], 'select': {'readings': 'count()'}}
+        first = self.query(spec).data
+        self.assertFalse(first['cached'])
+        self.assertTrue(self.query(spec).data['cached'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.query(spec)
+        self.assertFalse([q for q in queries.captured_queries if 'sensorreading' in q['sql']])
+
+        SensorReading.objects.filter(slope_zone='Zone A').first().delete()
+        caching.bump(caching.SENSORS)
+        analytics.snapshots.refresh()
+        second = self.query(spec).data
+        self.assertFalse(second['cached'])
+        self.assertEqual(second['results'][0]['readings'], first['results'][0]['readings'] - 1)
+
+    def test_invalid_queries_are_rejected(self):
+        for spec in (
+            {'where': [['no_such_column', 'eq', 1]]},
+            {'where': [['slope_zone', 'gt', 'Zone A']]},
+            {'where': [['timestamp', 'gte', 'yesterday']]},
+            {'group_by': ['slope_zone:10']},
+            {'select': {'x': 'median(pore_pressure_psi)'}},
+            {'order_by': ['-missing']},
+        ):
+            response = self.query(spec)
+            self.assertEqual(response.status_code, 400, spec)
+            self.assertIn('error', response.data)
+
+    def test_schema_lists_columns(self):
+        response = self.client.get('/api/analytics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['columns']['slope_zone']['kind'], 'category')
+        self.assertEqual(response.data['snapshot']['rows'], 500)
@@ -2,11 +2,13 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenRefreshView
 from . import views
+from .metrics import metrics_view
 from .views_ml import PredictRockfallRisk
 
 router = DefaultRouter()
 router.register(r'sensors', views.SensorReadingViewSet, basename='sensor')
 router.register(r'alerts', views.AlertViewSet, basename='alert')
+router.register(r'uploads', views.UploadSessionViewSet, basename='upload')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -14,5 +16,7 @@ urlpatterns = [
     path('auth/logout/', views.logout_view, name='logout'),
     path('auth/profile/', views.profile_view, name='profile'),
     path('auth/token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('analytics/', views.analytics_view, name='analytics'),
     path('predict-risk/', PredictRockfallRisk.as_view(), name='predict-risk'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
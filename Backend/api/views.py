@@ -1,16 +1,29 @@
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import api_view, action, permission_classes
+from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import authenticate
-from .models import User, SensorReading, Alert
-from .serializers import UserSerializer, SensorReadingSerializer, AlertSerializer
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .authentication import RoleRefreshToken
+from .models import User, SensorReading, Alert, UploadSession
+from .renderers import FastJSONRenderer
+from .serializers import (
+    UserSerializer, SensorReadingSerializer, AlertSerializer, SensorLocationSerializer, UploadSessionSerializer, RowEncoder,
+)
+from . import analytics, caching, ingest, retention, spatial
+from .caching import cached_read
 import csv
-from io import TextIOWrapper
-from decimal import Decimal
+import logging
+import math
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 
 # ==================== AUTH VIEWS ====================
 
@@ -25,12 +38,8 @@ def login_view(request):
     password = request.data.get('password')
     role = request.data.get('role')
     
-    try:
-        user = User.objects.get(email=email)
-    except User.DoesNotExist:
-        return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
-    
-    authenticated_user = authenticate(username=user.username, password=password)
+    # EmailBackend looks the user up by email once (see AUTHENTICATION_BACKENDS).
+    authenticated_user = authenticate(request, email=email, password=password)
     
     if not authenticated_user:
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
@@ -38,7 +47,7 @@ def login_view(request):
     if authenticated_user.role != role:
         return Response({'error': f'You do not have {role} access'}, status=status.HTTP_403_FORBIDDEN)
     
-    refresh = RefreshToken.for_user(authenticated_user)
+    refresh = RoleRefreshToken.for_user(authenticated_user)
     
     return Response({
         'user': {
@@ -77,12 +86,60 @@ def profile_view(request):
 
 # ==================== SENSOR VIEWSET ====================
 
+class SensorReadingPagination(PageNumberPagination):
+    """PAGE_SIZE by default; map and table clients ask for more with ?page_size="""
+    page_size_query_param = 'page_size'
+    
+    @property
+    def max_page_size(self):
+        return settings.SENSOR_LIST_MAX_PAGE_SIZE
+
+
 class SensorReadingViewSet(viewsets.ModelViewSet):
     queryset = SensorReading.objects.all().order_by('-timestamp')
     serializer_class = SensorReadingSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = SensorReadingPagination
+    row_encoder = RowEncoder(SensorReadingSerializer)
+    
+    def get_renderers(self):
+        # The listing holds only strings, ints, bools and Decimals, which
+        # FastJSONRenderer writes exactly like the stock renderer.
+        if self.action == 'list':
+            return [FastJSONRenderer(), BrowsableAPIRenderer()]
+        return super().get_renderers()
+    
+    @cached_read(caching.SENSORS)
+    def list(self, request, *args, **kwargs):
+        """List readings from value tuples instead of model instances"""
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values_list(*self.row_encoder.columns)
+        
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(self.row_encoder.encode_many(page))
+        return Response(self.row_encoder.encode_many(rows))
+    
+    @cached_read(caching.SENSORS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        spatial.index_readings([serializer.instance])
+    
+    def perform_update(self, serializer):
+        previous_sensor = serializer.instance.sensor_id
+        super().perform_update(serializer)
+        # The edit may move the sensor's newest reading, or the reading to another sensor.
+        spatial.reindex({previous_sensor, serializer.instance.sensor_id})
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        spatial.reindex([instance.sensor_id])
     
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    @cached_read(caching.SENSORS)
     def statistics(self, request):
         """Get sensor statistics"""
         stats = {
@@ -93,157 +150,176 @@ class SensorReadingViewSet(viewsets.ModelViewSet):
         }
         return Response(stats)
     
+    @staticmethod
+    def _float_params(request, names):
+        try:
+            values = [float(request.query_params[name]) for name in names]
+        except KeyError as e:
+            raise ValueError(f'Missing parameter {e}')
+        except ValueError:
+            values = None
+        if values is None or not all(math.isfinite(value) for value in values):
+            raise ValueError(f'Parameters {", ".join(names)} must be finite numbers')
+        return values
+    
+    @staticmethod
+    def _check_point(lat, lon):
+        if not -90 <= lat <= 90:
+            raise ValueError('Latitudes must be between -90 and 90')
+        if not -180 <= lon <= 180:
+            raise ValueError('Longitudes must be between -180 and 180')
+    
+    def _bbox_params(self, request):
+        min_lat, min_lon, max_lat, max_lon = self._float_params(request, ['min_lat', 'min_lon', 'max_lat', 'max_lon'])
+        self._check_point(min_lat, min_lon)
+        self._check_point(max_lat, max_lon)
+        if min_lat > max_lat or min_lon > max_lon:
+            raise ValueError('min_lat/min_lon must not exceed max_lat/max_lon')
+        return min_lat, min_lon, max_lat, max_lon
+    
+    @action(detail=False, methods=['get'])
+    @cached_read(caching.SENSORS)
+    def within(self, request):
+        """Sensors inside a bounding box"""
+        try:
+            min_lat, min_lon, max_lat, max_lon = self._bbox_params(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        locations = spatial.within(min_lat, min_lon, max_lat, max_lon)
+        return Response(SensorLocationSerializer(locations, many=True).data)
+    
+    @action(detail=False, methods=['get'])
+    @cached_read(caching.SENSORS)
+    def nearest(self, request):
+        """K sensors nearest to a point"""
+        try:
+            lat, lon = self._float_params(request, ['lat', 'lon'])
+            self._check_point(lat, lon)
+            k = int(request.query_params.get('k', 5))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= k <= 100:
+            return Response({'error': 'k must be between 1 and 100'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        results = []
+        for distance_m, location in spatial.nearest(lat, lon, k):
+            data = SensorLocationSerializer(location).data
+            data['distance_m'] = round(distance_m, 1)
+            results.append(data)
+        return Response(results)
+    
+    @action(detail=False, methods=['get'])
+    @cached_read(caching.SENSORS)
+    def cells(self, request):
+        """Latest risk aggregated per grid cell"""
+        bbox = [None] * 4
+        if 'min_lat' in request.query_params:
+            try:
+                bbox = self._bbox_params(request)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'cell_size_deg': spatial.cell_size(),
+            'cells': spatial.cell_aggregates(*bbox),
+        })
+    
+    @staticmethod
+    def _time_range(request):
+        bounds = []
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            if not value:
+                bounds.append(None)
+                continue
+            parsed = parse_datetime(value)
+            if parsed is None:
+                day = parse_date(value)
+                if day is None:
+                    raise ValueError(f'{name} must be an ISO date or datetime')
+                parsed = datetime(day.year, day.month, day.day)
+            if timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            bounds.append(parsed)
+        return bounds
+    
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream readings, hot and archived, as CSV in the upload format"""
+        try:
+            start, end = self._time_range(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        zone = request.query_params.get('zone') or None
+        
+        class Echo:
+            def write(self, value):
+                return value
+        
+        writer = csv.writer(Echo())
+        header = [field.attname for field in retention.export_columns()]
+        rows = retention.iter_rows(start, end, zone)
+        
+        def stream():
+            yield writer.writerow(header)
+            for row in rows:
+                yield writer.writerow(row)
+        
+        response = StreamingHttpResponse(stream(), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="sensor_readings.csv"'
+        return response
+    
+    @action(detail=False, methods=['get'])
+    @cached_read(caching.SENSORS)
+    def rollup(self, request):
+        """Daily per-zone aggregates across hot and archived readings"""
+        try:
+            start, end = self._time_range(request)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        zone = request.query_params.get('zone') or None
+        return Response(retention.daily_rollup(start, end, zone))
+    
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
     def upload_csv(self, request):
-        """Upload CSV file"""
+        """Upload a .csv, .csv.gz or .zip file; rows already stored are skipped"""
         if 'file' not in request.FILES:
             return Response({'error': 'No file provided'}, status=status.HTTP_400_BAD_REQUEST)
         
         csv_file = request.FILES['file']
         
-        if not csv_file.name.endswith('.csv'):
-            return Response({'error': 'File must be CSV'}, status=status.HTTP_400_BAD_REQUEST)
+        if not ingest.is_supported(csv_file.name):
+            return Response({'error': 'File must be .csv, .csv.gz or .zip'}, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            decoded_file = TextIOWrapper(csv_file.file, encoding='utf-8')
-            csv_reader = csv.DictReader(decoded_file)
-            
-            created_count = 0
-            error_count = 0
-            error_messages = []
-            
-            for row_num, row in enumerate(csv_reader, start=2):
-                try:
-                    def safe_decimal(value):
-                        if not value or value.strip() == '':
-                            return Decimal('0')
-                        return Decimal(value)
-                    
-                    def safe_int(value):
-                        if not value or value.strip() == '':
-                            return 0
-                        return int(float(value))
-                    
-                    def safe_bool(value):
-                        if isinstance(value, str):
-                            return value.strip().lower() in ['true', '1', 'yes']
-                        return bool(int(value))
-                    
-                    timestamp_str = row['timestamp'].strip()
-                    timestamp = None
-                    for fmt in ['%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%m/%d/%Y %H:%M:%S', '%m/%d/%Y']:
-                        try:
-                            timestamp = datetime.strptime(timestamp_str, fmt)
-                            break
-                        except ValueError:
-                            continue
-                    
-                    if not timestamp:
-                        raise ValueError(f"Cannot parse timestamp: {timestamp_str}")
-                    
-                    sensor_reading = SensorReading.objects.create(
-                        timestamp=timestamp,
-                        year=safe_int(row['year']),
-                        month=safe_int(row['month']),
-                        day_of_year=safe_int(row['day_of_year']),
-                        hour=safe_int(row['hour']),
-                        shift=row['shift'].strip(),
-                        sensor_id=row['sensor_id'].strip(),
-                        latitude=safe_decimal(row['latitude']),
-                        longitude=safe_decimal(row['longitude']),
-                        elevation_ft=safe_decimal(row['elevation_ft']),
-                        weather_station_id=row['weather_station_id'].strip(),
-                        sensor_status=row['sensor_status'].strip(),
-                        data_quality_flag=row['data_quality_flag'].strip(),
-                        temperature_f=safe_decimal(row['temperature_f']),
-                        precipitation_in=safe_decimal(row['precipitation_in']),
-                        humidity_pct=safe_decimal(row['humidity_pct']),
-                        wind_speed_mph=safe_decimal(row['wind_speed_mph']),
-                        barometric_pressure_inhg=safe_decimal(row['barometric_pressure_inhg']),
-                        slope_zone=row['slope_zone'].strip(),
-                        slope_angle_deg=safe_decimal(row['slope_angle_deg']),
-                        bench_height_ft=safe_decimal(row['bench_height_ft']),
-                        rock_type=row['rock_type'].strip().upper(),
-                        rock_mass_rating=safe_int(row['rock_mass_rating']),
-                        joint_spacing_ft=safe_decimal(row['joint_spacing_ft']),
-                        joint_orientation_deg=safe_decimal(row['joint_orientation_deg']),
-                        depth_to_water_ft=safe_decimal(row['depth_to_water_ft']),
-                        pore_pressure_psi=safe_decimal(row['pore_pressure_psi']),
-                        blast_frequency_7days=safe_int(row['blast_frequency_7days']),
-                        distance_to_blast_ft=safe_decimal(row['distance_to_blast_ft']),
-                        blast_magnitude_lbs=safe_decimal(row['blast_magnitude_lbs']),
-                        equipment_passes_per_shift=safe_int(row['equipment_passes_per_shift']),
-                        microseismic_events_daily=safe_int(row['microseismic_events_daily']),
-                        max_seismic_magnitude=safe_decimal(row['max_seismic_magnitude']),
-                        displacement_rate_mm_per_day=safe_decimal(row['displacement_rate_mm_per_day']),
-                        cumulative_displacement_mm=safe_decimal(row['cumulative_displacement_mm']),
-                        tiltmeter_microradians=safe_decimal(row['tiltmeter_microradians']),
-                        strain_gauge_microstrain=safe_decimal(row['strain_gauge_microstrain']),
-                        vibration_ppv_mm_per_s=safe_decimal(row['vibration_ppv_mm_per_s']),
-                        rockfall_risk_score=safe_decimal(row['rockfall_risk_score']),
-                        rockfall_occurred=safe_bool(row['rockfall_occurred']),
-                        rockfall_size_category=row['rockfall_size_category'].strip(),
-                    )
-                    
-                    risk_score = float(sensor_reading.rockfall_risk_score)
-                    if risk_score >= 50:
-                        alert_type = 'CRITICAL' if risk_score >= 75 else 'HIGH'
-                        Alert.objects.create(
-                            alert_id=f'ALERT-{sensor_reading.sensor_id}-{sensor_reading.id}',
-                            sensor_reading=sensor_reading,
-                            alert_type=alert_type,
-                            status='ACTIVE',
-                            zone_name=sensor_reading.slope_zone,
-                            risk_score=sensor_reading.rockfall_risk_score,
-                            recommended_action='Monitor closely and restrict access.'
-                        )
-                    
-                    created_count += 1
-                    
-                except KeyError as e:
-                    error_count += 1
-                    error_msg = f"Row {row_num}: Missing column {str(e)}"
-                    error_messages.append(error_msg)
-                    print(error_msg)
-                    
-                except Exception as e:
-                    error_count += 1
-                    error_msg = f"Row {row_num}: {type(e).__name__} - {str(e)}"
-                    error_messages.append(error_msg)
-                    print(error_msg)
-            
-            response_data = {
-                'message': 'CSV processed',
-                'created': created_count,
-                'errors': error_count,
-                'total_processed': created_count + error_count
-            }
-            
-            if error_messages:
-                response_data['error_samples'] = error_messages[:10]
-            
-            return Response(response_data, status=status.HTTP_201_CREATED)
-            
+            result = ingest.ingest(ingest.open_csv(csv_file.file, csv_file.name))
+            return Response({'message': 'CSV processed', **result}, status=status.HTTP_201_CREATED)
+        
+        except ingest.INPUT_ERRORS as e:
+            return Response({'error': f'Cannot read file: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
+            logger.exception('Failed to process CSV')
             return Response({'error': f'Failed to process CSV: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
     @action(detail=False, methods=['delete'], permission_classes=[IsAuthenticated])
     def clear_all(self, request):
-        """Clear all data - Admin only"""
+        """Clear all data, hot and archived - Admin only"""
         if request.user.role != 'ADMIN':
             return Response({'error': 'Only admins can clear data'}, status=status.HTTP_403_FORBIDDEN)
         
         try:
-            sensor_count = SensorReading.objects.count()
-            alert_count = Alert.objects.count()
-            Alert.objects.all().delete()
-            SensorReading.objects.all().delete()
+            deleted = retention.truncate()
+            archived_parts = retention.purge_archive()
+            caching.bump(caching.SENSORS, caching.ALERTS)
             return Response({
                 'message': 'All data cleared',
-                'sensors_deleted': sensor_count,
-                'alerts_deleted': alert_count,
+                'sensors_deleted': deleted['sensorreading'],
+                'alerts_deleted': deleted['alert'],
+                'archive_parts_deleted': archived_parts,
             })
         except Exception as e:
+            logger.exception('Failed to clear data')
             return Response({'error': f'Failed: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
@@ -254,7 +330,16 @@ class AlertViewSet(viewsets.ModelViewSet):
     serializer_class = AlertSerializer
     permission_classes = [IsAuthenticated]
     
+    @cached_read(caching.ALERTS, caching.SENSORS)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @cached_read(caching.ALERTS, caching.SENSORS)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'])
+    @cached_read(caching.ALERTS)
     def dashboard_stats(self, request):
         """Get dashboard stats"""
         stats = {
@@ -264,3 +349,86 @@ class AlertViewSet(viewsets.ModelViewSet):
             'high_alerts': Alert.objects.filter(alert_type='HIGH', status='ACTIVE').count(),
         }
         return Response(stats)
+
+
+# ==================== UPLOAD VIEWSET ====================
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable chunked uploads.
+    
+    POST /uploads/ {filename, total_size, sha256} starts a session; PUT
+    /uploads/<id>/chunk/ sends the raw bytes at the X-Upload-Offset header
+    with their hex digest in X-Chunk-SHA256; GET /uploads/<id>/ returns the
+    stored offset to resume from; POST /uploads/<id>/complete/ ingests the file.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return UploadSession.objects.filter(created_by=self.request.user)
+    
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+    
+    def perform_destroy(self, instance):
+        ingest.discard_upload(instance)
+        super().perform_destroy(instance)
+    
+    def _upload_error(self, session, error):
+        session.refresh_from_db()
+        return Response({'error': str(error), 'offset': session.received_bytes}, status=error.status_code)
+    
+    @action(detail=True, methods=['put'])
+    def chunk(self, request, pk=None):
+        """Append one chunk"""
+        session = self.get_object()
+        try:
+            offset = int(request.headers['X-Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({'error': 'X-Upload-Offset and Content-Length headers are required', 'offset': session.received_bytes},
+                            status=status.HTTP_400_BAD_REQUEST)
+        checksum = request.headers.get('X-Chunk-SHA256')
+        if not checksum:
+            return Response({'error': 'X-Chunk-SHA256 header is required', 'offset': session.received_bytes},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            received = ingest.append_chunk(session, offset, length, checksum, request.stream)
+        except ingest.UploadError as e:
+            return self._upload_error(session, e)
+        return Response({'offset': received})
+    
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """Verify and ingest the uploaded file"""
+        session = self.get_object()
+        try:
+            result = ingest.complete_upload(session)
+        except ingest.UploadError as e:
+            return self._upload_error(session, e)
+        except ingest.INPUT_ERRORS as e:
+            return Response({'error': f'Cannot read file: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'message': 'CSV processed', **result})
+
+
+# ==================== ANALYTICS ====================
+
+@api_view(['GET', 'POST', 'OPTIONS'])
+@permission_classes([IsAuthenticated])
+def analytics_view(request):
+    """
+    GET lists the queryable columns; POST runs a filter/group/aggregate
+    query (see api/analytics.py) against the in-memory reading snapshot.
+    """
+    if request.method == 'OPTIONS':
+        return Response(status=status.HTTP_200_OK)
+    if request.method == 'GET':
+        return Response({'snapshot': analytics.snapshots.get().describe(), **analytics.schema()})
+    
+    try:
+        return Response(analytics.run(request.data))
+    except analytics.QueryError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -3,26 +3,39 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 import joblib
+import logging
 import numpy as np
 import os
 import tensorflow as tf
 import warnings
+from . import metrics
 
 warnings.filterwarnings('ignore', category=UserWarning)
 
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RF_MODEL_PATH = os.path.join(BASE_DIR, 'rf_risk_model.joblib')
+SCALER_PATH = os.path.join(BASE_DIR, 'rf_scaler.joblib')
+DL_MODEL_PATH = os.path.join(BASE_DIR, 'dl_risk_model.keras')
+
+
+@metrics.timed('model_load_seconds', model='rf')
+def load_rf_model():
+    return joblib.load(RF_MODEL_PATH), joblib.load(SCALER_PATH)
+
+
+@metrics.timed('model_load_seconds', model='dl')
+def load_dl_model():
+    return tf.keras.models.load_model(DL_MODEL_PATH, compile=False)
+
+
 class PredictRockfallRisk(APIView):
     permission_classes = [AllowAny]
     
     def post(self, request):
         try:
-            base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            
-            rf_model_path = os.path.join(base_dir, 'rf_risk_model.joblib')
-            scaler_path = os.path.join(base_dir, 'rf_scaler.joblib')
-            dl_model_path = os.path.join(base_dir, 'dl_risk_model.keras')
-            
-            rf_model = joblib.load(rf_model_path)
-            scaler = joblib.load(scaler_path)
+            rf_model, scaler = load_rf_model()
             
             data = request.data
             
@@ -43,13 +56,15 @@ class PredictRockfallRisk(APIView):
             features_scaled = scaler.transform([features])
             
             # Random Forest Prediction
-            rf_prediction = float(rf_model.predict(features_scaled)[0])
+            with metrics.timer('inference_seconds', model='rf'):
+                rf_prediction = float(rf_model.predict(features_scaled)[0])
             rf_prediction = max(0, min(100, rf_prediction))
             
             # Deep Learning Prediction
             try:
-                dl_model = tf.keras.models.load_model(dl_model_path, compile=False)
-                dl_raw = float(dl_model.predict(features_scaled, verbose=0)[0][0])
+                dl_model = load_dl_model()
+                with metrics.timer('inference_seconds', model='dl'):
+                    dl_raw = float(dl_model.predict(features_scaled, verbose=0)[0][0])
                 
                 # Scale DL output to 0-100 range
                 # If model outputs large values, normalize them
@@ -59,7 +74,7 @@ class PredictRockfallRisk(APIView):
                     dl_prediction = max(0, min(100, dl_raw))
                     
             except Exception as e:
-                print(f"DL model error: {e}")
+                logger.warning("DL model error: %s", e)
                 # Use RF with slight variation
                 dl_prediction = rf_prediction * np.random.uniform(0.90, 1.05)
                 dl_prediction = max(0, min(100, dl_prediction))
@@ -70,7 +85,7 @@ class PredictRockfallRisk(APIView):
             }, status=status.HTTP_200_OK)
             
         except Exception as e:
-            print(f"Prediction error: {str(e)}")
+            logger.exception("Prediction error")
             return Response(
                 {'error': str(e)}, 
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -29,6 +29,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.metrics.MetricsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,10 +55,50 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database - SQLite for simplicity
+# SQLite in WAL mode with persistent connections. Writes use 'default';
+# reads use 'read', separate query-only connections to the same file
+# (see api/db.py).
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 plus the transaction_mode option
+        'ENGINE': 'api.backends.sqlite3',
         'NAME': BASE_DIR / config('DATABASE_NAME', default='db.sqlite3'),
+        'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Seconds to wait for another connection's write lock
+            'timeout': config('DATABASE_TIMEOUT', default=20, cast=int),
+            # Take that lock when a transaction starts, so waiting for it
+            # uses the timeout instead of failing (see api/backends/sqlite3)
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+}
+DATABASES['read'] = dict(
+    DATABASES['default'],
+    OPTIONS={'timeout': DATABASES['default']['OPTIONS']['timeout']},
+    TEST={'MIRROR': 'default'},
+)
+
+DATABASE_ROUTERS = ['api.db.ReadWriteRouter']
+
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',  # WAL stays consistent; only the last commits can be lost on power failure
+    'cache_size': -64000,  # 64 MB page cache per connection
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456,
+    'wal_autocheckpoint': 1000,
+}
+
+# Cache - rendered API responses keyed by data version (see api/caching.py).
+# Point this at Redis/Memcached to share entries between worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'stratanet-api',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
     }
 }
 
@@ -87,6 +128,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom User Model
 AUTH_USER_MODEL = 'api.User'
 
+# The API logs in by email; the admin by username
+AUTHENTICATION_BACKENDS = [
+    'api.authentication.EmailBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # CORS Configuration
 # Add this to let corsheaders handle OPTIONS automatically
 CORS_PREFLIGHT_MAX_AGE = 86400  # Cache preflight for 24 hours
@@ -112,13 +159,15 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-upload-offset',
+    'x-chunk-sha256',
 ]
 
 
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',  # ← Change to AllowAny for testing
@@ -127,6 +176,9 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 100,
 }
 
+# Largest ?page_size= the sensor reading listing accepts
+SENSOR_LIST_MAX_PAGE_SIZE = config('SENSOR_LIST_MAX_PAGE_SIZE', default=5000, cast=int)
+
 
 # JWT Settings
 SIMPLE_JWT = {
@@ -137,3 +189,59 @@ SIMPLE_JWT = {
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+
+# Seconds a token's user is served from the in-process cache (0 disables)
+AUTH_USER_CACHE_SECONDS = config('AUTH_USER_CACHE_SECONDS', default=60, cast=int)
+
+
+# Spatial index grid cell size, in degrees of latitude/longitude (~1.1 km)
+SPATIAL_GRID_CELL_DEG = config('SPATIAL_GRID_CELL_DEG', default=0.01, cast=float)
+
+
+# Retention - readings older than RETENTION_DAYS are moved to compressed
+# per-month/per-zone archives under ARCHIVE_ROOT (see api/retention.py)
+RETENTION_DAYS = config('RETENTION_DAYS', default=365, cast=int)
+RETENTION_CHUNK_SIZE = config('RETENTION_CHUNK_SIZE', default=2000, cast=int)
+ARCHIVE_PART_ROWS = config('ARCHIVE_PART_ROWS', default=100000, cast=int)
+ARCHIVE_ROOT = Path(config('ARCHIVE_ROOT', default=str(BASE_DIR / 'archive')))
+
+
+# Resumable uploads - chunks are appended to UPLOAD_ROOT/<session>.part
+# until the session is completed (see api/ingest.py)
+UPLOAD_ROOT = Path(config('UPLOAD_ROOT', default=str(BASE_DIR / 'uploads')))
+UPLOAD_CHUNK_BYTES = config('UPLOAD_CHUNK_BYTES', default=8 * 1024 * 1024, cast=int)
+
+# `manage.py test` points ARCHIVE_ROOT and UPLOAD_ROOT at a temporary directory
+TEST_RUNNER = 'config.test_runner.TestRunner'
+
+
+# Admin - changelists above ADMIN_EXACT_COUNT_LIMIT rows show a cached
+# table count; distinct-value filter choices are cached (see api/admin.py)
+ADMIN_EXACT_COUNT_LIMIT = config('ADMIN_EXACT_COUNT_LIMIT', default=10000, cast=int)
+ADMIN_FILTER_CACHE_SECONDS = config('ADMIN_FILTER_CACHE_SECONDS', default=300, cast=int)
+ADMIN_COUNT_CACHE_SECONDS = config('ADMIN_COUNT_CACHE_SECONDS', default=60, cast=int)
+
+
+# Analytics - each process answers /api/analytics/ from an in-memory
+# columnar snapshot, checked for new data every ANALYTICS_REFRESH_SECONDS
+# and rebuilt in the background (see api/analytics.py)
+ANALYTICS_REFRESH_SECONDS = config('ANALYTICS_REFRESH_SECONDS', default=60, cast=float)
+ANALYTICS_CACHE_SECONDS = config('ANALYTICS_CACHE_SECONDS', default=300, cast=int)
+ANALYTICS_MAX_GROUPS = config('ANALYTICS_MAX_GROUPS', default=10000, cast=int)
+
+
+# Metrics - /api/metrics/ requires "Authorization: Bearer <METRICS_TOKEN>" when set,
+# and an admin user otherwise
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Logging
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
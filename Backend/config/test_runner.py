@@ -0,0 +1,21 @@
+import tempfile
+from pathlib import Path
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """Runs the suite with the archive and upload directories in a temporary directory"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._workdir = tempfile.TemporaryDirectory()
+        workdir = Path(self._workdir.name)
+        self._files = override_settings(ARCHIVE_ROOT=workdir / 'archive', UPLOAD_ROOT=workdir / 'uploads')
+        self._files.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._files.disable()
+        self._workdir.cleanup()
+        super().teardown_test_environment(**kwargs)